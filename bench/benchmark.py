@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+
+# Benchmarks for startup, read and save paths.
+# Headless benchmarks always run, GUI ones need PyGObject and a display (e.g. xvfb-run).
+#
+#   bench/benchmark.py --output results.json
+#   xvfb-run bench/benchmark.py --gui --baseline results.json
+
+import argparse
+import glob
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, os.pardir, 'src'))
+
+from application import batch, layers, main, schema
+from application.inifile import IniFile
+
+UI_FILE = os.path.join(HERE, os.pardir, 'data', 'interface.ui')
+FIXTURES = sorted(glob.glob(os.path.join(HERE, 'fixtures', '*.conf')))
+
+
+def synthetic_config(sections=50, keys=20, comments=0.5, seed=0):
+    # Known greeter sections followed by unknown ones, comment lines are mixed in with given ratio
+    rnd = random.Random(seed)
+    lines = []
+    names = list(schema.OPTIONS) + ['section-{}'.format(i) for i in range(max(0, sections - len(schema.OPTIONS)))]
+    for section in names[:sections]:
+        lines.append('[{}]'.format(section))
+        known = list(schema.OPTIONS.get(section, ()))
+        for i in range(keys):
+            key = known[i] if i < len(known) else 'key-{}'.format(i)
+            value = str(schema.OPTIONS[section][key].default) if i < len(known) else 'value-{}'.format(i)
+            if rnd.random() < comments:
+                lines.append('# Description of {}'.format(key))
+                lines.append('#{}={}'.format(key, value))
+            else:
+                lines.append('{}={}'.format(key, value))
+        lines.append('')
+    return '\n'.join(lines)
+
+def measure(func, repeat, setup=None):
+    times = []
+    for _ in range(repeat):
+        arg = setup() if setup else None
+        start = time.perf_counter()
+        func(arg) if setup else func()
+        times.append(time.perf_counter() - start)
+    return times
+
+def result(name, times, **params):
+    return {'name': name, 'params': params, 'runs': len(times),
+            'mean_ms': statistics.mean(times) * 1000, 'min_ms': min(times) * 1000,
+            'stdev_ms': statistics.stdev(times) * 1000 if len(times) > 1 else 0.0}
+
+
+def headless_benchmarks(tmp, repeat):
+    results = []
+    configs = [(os.path.basename(path), open(path).read()) for path in FIXTURES]
+    configs += [('synthetic-{}x{}-c{}'.format(s, k, c), synthetic_config(s, k, c))
+                for s, k, c in ((10, 10, 0.0), (10, 10, 0.9), (200, 50, 0.5))]
+    for name, text in configs:
+        results.append(result('inifile.parse', measure(lambda: IniFile(text), repeat), config=name, bytes=len(text)))
+
+    patch = batch.read_patch(['appearance.theme-name=Adwaita', 'appearance.xft-dpi=120', 'clock.time-format=%H:%M'],
+                             ['a11y.osk'])
+    for name, text in configs:
+        path = os.path.join(tmp, name)
+        def setup():
+            with open(path, 'w') as file:
+                file.write(text)
+            return path
+        results.append(result('batch.process_file', measure(lambda p: batch.process_file(p, patch), repeat, setup),
+                              config=name))
+
+    count = 1000
+    paths = []
+    for i in range(count):
+        paths.append(os.path.join(tmp, 'fleet-{}.conf'.format(i)))
+        shutil.copy(FIXTURES[0], paths[-1])
+    times = measure(lambda: [batch.process_file(p, patch) for p in paths], 1)
+    results.append(result('batch.fleet', times, files=count))
+
+    os.environ['XDG_CACHE_HOME'] = os.path.join(tmp, 'cache')
+    results.append(result('schema.compile_index', measure(lambda: schema.compile_index(UI_FILE), repeat)))
+    schema.get_index(UI_FILE)
+    results.append(result('schema.get_index.cached', measure(lambda: schema.get_index(UI_FILE), repeat)))
+    return results
+
+
+def gui_benchmarks(tmp, repeat):
+    main.import_gui()
+    results = []
+    config = os.path.join(tmp, 'greeter.conf')
+    shutil.copy(os.path.join(HERE, 'fixtures', 'shipped.conf'), config)
+    # Layers of the host lightdm configuration are not read
+    lightdm_config = os.path.join(tmp, 'lightdm', 'lightdm.conf')
+    os.makedirs(os.path.dirname(lightdm_config))
+    open(lightdm_config, 'w').close()
+    layers.SYSTEM_DIRS = ()
+
+    def prefs(path=config):
+        return vars(main.create_parser().parse_args(['--greeter-config', path, '--ui-file', UI_FILE,
+                                                    '--lightdm-config', lightdm_config,
+                                                    '--greeter-config-output', os.path.join(tmp, 'output.conf')]))
+    def application(path=config, pages=False):
+        app = main.Application(prefs(path))
+        if pages:
+            app.load_all_pages()
+        return app
+
+    results.append(result('Application.__init__', measure(application, repeat)))
+    results.append(result('Application.__init__', measure(lambda: application(pages=True), repeat), pages='all'))
+    app = application()
+    results.append(result('Application.create_gui', measure(app.create_gui, repeat)))
+
+    for path in FIXTURES:
+        app = application(path, pages=True)
+        results.append(result('Application.read', measure(app.read, repeat), config=os.path.basename(path)))
+
+    app = application(pages=True)
+    options = list(app.options)
+    for count in (1, 10, len(options)):
+        def setup():
+            app.read()
+            for option in options[:count]:
+                option.touch()
+        results.append(result('Application.save', measure(lambda arg: app.save(), repeat, setup), changed=count))
+
+    app.read()
+    results.append(result('Application._on_reset_clicked', measure(app._on_reset_clicked, repeat)))
+    return results
+
+
+def compare(results, baseline, threshold):
+    # Prints relative change against baseline, returns number of regressions
+    def key(r):
+        return r['name'], json.dumps(r['params'], sort_keys=True)
+    base = {key(r): r for r in baseline}
+    regressions = 0
+    for r in results:
+        b = base.get(key(r))
+        if not b:
+            continue
+        ratio = r['mean_ms'] / b['mean_ms'] if b['mean_ms'] else 1.0
+        regressed = ratio > 1 + threshold
+        regressions += regressed
+        print('{:<34}{:<40}{:>10.3f}{:>10.3f}{:>8.2f}x{}'.format(r['name'], json.dumps(r['params'], sort_keys=True)[:38],
+                                                               b['mean_ms'], r['mean_ms'], ratio,
+                                                               '  REGRESSION' if regressed else ''))
+    return regressions
+
+
+def run(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark read, save and startup paths')
+    parser.add_argument('--gui', action='store_true', help='Run GUI benchmarks (needs PyGObject and display)')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--output', help='Write results as JSON')
+    parser.add_argument('--baseline', help='Compare with results of previous run')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Allowed slowdown against baseline')
+    args = parser.parse_args(argv)
+
+    tmp = tempfile.mkdtemp(prefix='greeter-settings-bench-')
+    try:
+        results = headless_benchmarks(tmp, args.repeat)
+        if args.gui:
+            results += gui_benchmarks(tmp, args.repeat)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    data = {'python': sys.version.split()[0], 'results': results}
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(data, file, indent=1)
+    else:
+        json.dump(data, sys.stdout, indent=1)
+        print()
+    if args.baseline:
+        with open(args.baseline) as file:
+            return 1 if compare(results, json.load(file)['results'], args.threshold) else 0
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(run())
@@ -0,0 +1,133 @@
+#!/usr/bin/python3
+
+import configparser
+import sys
+
+from .inifile import IniFile
+from .schema import OPTIONS
+
+
+__all__ = ['run', 'read_patch', 'read_base', 'format_patch', 'apply_patch']
+
+BASE_PREFIX = 'base:'
+
+class PatchError(Exception):
+    pass
+
+def check_option(section, key, value=None):
+    try:
+        value_type = OPTIONS[section][key].type
+    except KeyError:
+        raise PatchError('unknown option: {}.{}'.format(section, key))
+    if value is None:
+        return None
+    try:
+        return value_type.format_value(value)
+    except ValueError as e:
+        raise PatchError('{}.{}: {}'.format(section, key, e))
+
+def split_option(path):
+    section, dot, key = path.partition('.')
+    if not dot or not section or not key:
+        raise PatchError('option must be specified as SECTION.KEY: {!r}'.format(path))
+    return section, key
+
+def read_ini(filename):
+    # Yields (section, key, value), value is None for keys without value
+    config = configparser.ConfigParser(allow_no_value=True, interpolation=None)
+    try:
+        with open(filename) as file:
+            config.read_file(file)
+    except (OSError, configparser.Error) as e:
+        raise PatchError(str(e))
+    for section in config.sections():
+        for key, value in config.items(section):
+            yield section, key, value
+
+def read_patch(sets=(), unsets=(), files=()):
+    # Returns list of (section, key, value), value is None for removed options
+    patch = {}
+    for filename in files:
+        for section, key, value in read_ini(filename):
+            if not section.startswith(BASE_PREFIX):
+                patch[section, key] = check_option(section, key, value)
+    for item in sets:
+        path, eq, value = item.partition('=')
+        if not eq:
+            raise PatchError('value must be specified as SECTION.KEY=VALUE: {!r}'.format(item))
+        section, key = split_option(path)
+        patch[section, key] = check_option(section, key, value)
+    for path in unsets:
+        section, key = split_option(path)
+        check_option(section, key)
+        patch[section, key] = None
+    return [(section, key, value) for (section, key), value in patch.items()]
+
+def read_base(files=()):
+    # (section, key) -> value the patch was made from, None if option was not set
+    return {(section[len(BASE_PREFIX):], key): value
+            for filename in files for section, key, value in read_ini(filename) if section.startswith(BASE_PREFIX)}
+
+def format_patch(changes):
+    # changes: (section, key, value, base value), None values mean option is not set.
+    # Base values are kept in '[base:section]' sections, they are ignored when patch is applied
+    sections = {}
+    for section, key, value, base in changes:
+        sections.setdefault(section, []).append(key if value is None else '{}={}'.format(key, value))
+    for section, key, value, base in changes:
+        sections.setdefault(BASE_PREFIX + section, []).append(key if base is None else '{}={}'.format(key, base))
+    return '\n'.join('[{}]\n{}\n'.format(section, '\n'.join(lines)) for section, lines in sections.items())
+
+def apply_patch(config, patch):
+    # Returns number of changed options
+    return sum(config.remove_option(section, key) if value is None else config.set(section, key, value)
+               for section, key, value in patch)
+
+def process_file(path, patch, output=None):
+    with open(path, newline='') as file:
+        config = IniFile(file.read())
+    changed = apply_patch(config, patch)
+    if changed or (output and output != path):
+        config.write(output or path)
+    return changed
+
+def read_list(path):
+    # Non-empty lines of file or stdin ('-'), file is closed when iteration ends
+    if path == '-':
+        yield from filter(None, (line.strip() for line in sys.stdin))
+        return
+    with open(path) as file:
+        yield from filter(None, (line.strip() for line in file))
+
+def iter_configs(prefs):
+    yield from prefs['configs']
+    if prefs['config-list']:
+        yield from read_list(prefs['config-list'])
+
+def config_paths(prefs):
+    # CONFIG files and --config-list, --greeter-config if there are none
+    return iter_configs(prefs) if prefs['configs'] or prefs['config-list'] else iter((prefs['greeter-config'],))
+
+def run(prefs, out=sys.stdout):
+    try:
+        patch = read_patch(prefs['set'], prefs['unset'], prefs['apply-file'])
+    except PatchError as e:
+        print('error: {}'.format(e), file=sys.stderr)
+        return 2
+
+    if prefs['configs'] or prefs['config-list']:
+        targets = ((path, None) for path in iter_configs(prefs))
+    else:
+        targets = ((prefs['greeter-config'], prefs['greeter-config-output']),)
+
+    failed = 0
+    for path, output in targets:
+        try:
+            changed = process_file(path, patch, output)
+        except (OSError, UnicodeDecodeError) as e:
+            failed += 1
+            out.write('{}: error: {}\n'.format(path, e))
+        else:
+            out.write('{}: {}\n'.format(path, 'changed ({})'.format(changed) if changed else 'unchanged'))
+    out.flush()
+    return 1 if failed else 0
@@ -0,0 +1,30 @@
+#!/usr/bin/python3
+
+import json
+import os
+
+from .inifile import write_atomic
+
+
+__all__ = ['cache_path', 'load', 'store']
+
+def cache_path(*names):
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(base, 'lightdm-another-gtk-greeter-settings', *names)
+
+def load(name, key):
+    # Returns cached value if it was stored with the same key, None otherwise
+    try:
+        with open(cache_path(name)) as file:
+            data = json.load(file)
+    except (OSError, ValueError):
+        return None
+    return data.get('value') if data.get('key') == key else None
+
+def store(name, key, value):
+    path = cache_path(name)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        write_atomic(path, json.dumps({'key': key, 'value': value}).encode())
+    except OSError:
+        pass
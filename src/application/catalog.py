@@ -0,0 +1,56 @@
+#!/usr/bin/python3
+
+import os
+
+from . import cache
+
+
+__all__ = ['THEME_DIRS', 'ICON_DIRS', 'get_catalogs']
+
+THEME_DIRS = ('/usr/share/themes', '~/.local/share/themes', '~/.themes')
+ICON_DIRS = ('/usr/share/icons', '~/.local/share/icons', '~/.icons')
+
+def subdirs(dirs):
+    for directory in dirs:
+        try:
+            yield from (entry for entry in os.scandir(os.path.expanduser(directory)) if entry.is_dir())
+        except OSError:
+            pass
+
+def scan_themes(dirs=THEME_DIRS):
+    # Gtk3 themes
+    return sorted({entry.name for entry in subdirs(dirs) if os.path.isdir(os.path.join(entry.path, 'gtk-3.0'))})
+
+def scan_icon_themes(dirs=ICON_DIRS):
+    # Icon themes, cursor-only themes have no Directories key in index.theme
+    names = set()
+    for entry in subdirs(dirs):
+        try:
+            with open(os.path.join(entry.path, 'index.theme'), errors='replace') as file:
+                if any(line.startswith('Directories=') for line in file):
+                    names.add(entry.name)
+        except OSError:
+            pass
+    return sorted(names)
+
+def dirs_key(dirs):
+    key = []
+    for directory in dirs:
+        try:
+            key.append([directory, os.stat(os.path.expanduser(directory)).st_mtime_ns])
+        except OSError:
+            key.append([directory, None])
+    return key
+
+CATALOGS = {'themes': (THEME_DIRS, scan_themes), 'icons': (ICON_DIRS, scan_icon_themes)}
+
+def get_catalogs():
+    # name -> sorted list of names; every catalog is rescanned only when mtime of its directories changes
+    catalogs = {}
+    for name, (dirs, scan) in CATALOGS.items():
+        key = dirs_key(dirs)
+        catalogs[name] = cache.load('catalog-{}.json'.format(name), key)
+        if catalogs[name] is None:
+            catalogs[name] = scan(dirs)
+            cache.store('catalog-{}.json'.format(name), key, catalogs[name])
+    return catalogs
@@ -0,0 +1,124 @@
+#!/usr/bin/python3
+
+import json
+import os
+import sys
+
+from .batch import PatchError, apply_patch, check_option, iter_configs
+from .inifile import IniFile
+from .layers import LayeredConfig
+from .schema import OPTIONS
+
+
+__all__ = ['export_config', 'import_record', 'run_export', 'run_import']
+
+# One JSON object per line:
+# {"path": "...", "options": {"section": {"key": {"value": "...", "default": "...", "enabled": true, "source": "..."}}}}
+
+def default_value(option):
+    try:
+        return option.type.format_value(str(option.default))
+    except ValueError:
+        return str(option.default)
+
+def export_config(config, path):
+    # config is IniFile or LayeredConfig, options which are not set have default values
+    options = {}
+    for section, keys in OPTIONS.items():
+        for key, option in keys.items():
+            enabled = config.has_option(section, key)
+            default = default_value(option)
+            item = {'value': config.get(section, key) if enabled else default, 'default': default,
+                    'enabled': enabled, 'type': type(option.type).__name__.lower()}
+            if enabled:
+                source = config.source(section, key) if isinstance(config, LayeredConfig) else None
+                item['source'] = source.path if source else path
+            options.setdefault(section, {})[key] = item
+    return {'path': path, 'options': options}
+
+def json_value(value):
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, (int, float, str)):
+        return str(value)
+    raise PatchError('value must be string, number or boolean: {!r}'.format(value))
+
+def read_record(record):
+    # Returns patch for batch.apply_patch, options without value or with "enabled": false are removed
+    if not isinstance(record, dict) or not isinstance(record.get('options', {}), dict):
+        raise PatchError('record must be an object with "options" object')
+    patch = []
+    for section, keys in record.get('options', {}).items():
+        if not isinstance(keys, dict):
+            raise PatchError('{}: section must be an object'.format(section))
+        for key, item in keys.items():
+            if not isinstance(item, dict):
+                raise PatchError('{}.{}: option must be an object'.format(section, key))
+            if item.get('enabled', True) and item.get('value') is not None:
+                patch.append((section, key, check_option(section, key, json_value(item['value']))))
+            else:
+                check_option(section, key)
+                patch.append((section, key, None))
+    return patch
+
+def same_value(section, key, current, value):
+    try:
+        return current is not None and check_option(section, key, current) == value
+    except PatchError:
+        return False
+
+def import_record(record, path):
+    # Returns number of changed options
+    patch = read_record(record)
+    config = IniFile.read(path)
+    # Values equal to current ones after formatting are kept as they are written, e.g. 'off' for '0'
+    patch = [(section, key, value) for section, key, value in patch
+             if value is None or not same_value(section, key, config.get(section, key), value)]
+    changed = apply_patch(config, patch)
+    if changed:
+        config.write(path)
+    return changed
+
+def read_layers(lightdm_config, path):
+    # Other layers are optional, but missing greeter config is an error too
+    os.stat(path)
+    return LayeredConfig(lightdm_config, path)
+
+def run_export(prefs, out=sys.stdout):
+    if prefs['configs'] or prefs['config-list']:
+        configs = ((path, lambda path: IniFile.read(path, missing_ok=False)) for path in iter_configs(prefs))
+    else:
+        # Effective values of all lightdm configuration layers
+        configs = ((prefs['greeter-config'], lambda path: read_layers(prefs['lightdm-config'], path)),)
+    failed = 0
+    for path, read in configs:
+        try:
+            record = export_config(read(path), path)
+        except (OSError, UnicodeDecodeError) as e:
+            failed += 1
+            record = {'path': path, 'error': str(e)}
+        out.write(json.dumps(record, sort_keys=True) + '\n')
+    out.flush()
+    return 1 if failed else 0
+
+def run_import(prefs, stream=sys.stdin, out=sys.stdout):
+    # Records without "path" are applied to --greeter-config
+    failed = 0
+    for number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        path = prefs['greeter-config']
+        try:
+            record = json.loads(line)
+            path = (record.get('path') or path) if isinstance(record, dict) else path
+            changed = import_record(record, path)
+        except ValueError as e:
+            failed += 1
+            out.write('{}: error: line {}: {}\n'.format(path, number, e))
+        except (OSError, PatchError) as e:
+            failed += 1
+            out.write('{}: error: {}\n'.format(path, e))
+        else:
+            out.write('{}: {}\n'.format(path, 'changed ({})'.format(changed) if changed else 'unchanged'))
+    out.flush()
+    return 1 if failed else 0
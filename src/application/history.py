@@ -0,0 +1,72 @@
+#!/usr/bin/python3
+
+import time
+
+from collections import deque, namedtuple
+
+
+__all__ = ['History', 'Change']
+
+Change = namedtuple('Change', ('key', 'old', 'new', 'time'))
+
+class History:
+    # Undo/redo journal of (key, old state, new state) deltas.
+    # Edits of the same key within `coalesce` seconds are merged, only `limit` last changes are kept
+
+    def __init__(self, limit=500, coalesce=1.0, clock=time.monotonic):
+        self._undo = deque(maxlen=limit)
+        self._redo = []
+        self._coalesce = coalesce
+        self._clock = clock
+
+    def record(self, key, old, new):
+        if old == new:
+            return
+        now = self._clock()
+        self._redo.clear()
+        last = self._undo[-1] if self._undo else None
+        if last and last.key == key and now - last.time < self._coalesce:
+            self._undo.pop()
+            if last.old != new:
+                self._undo.append(last._replace(new=new, time=now))
+        else:
+            self._undo.append(Change(key, old, new, now))
+
+    def undo(self):
+        # Returns change to revert, None if history is empty
+        if not self._undo:
+            return None
+        change = self._undo.pop()
+        self._redo.append(change)
+        if self._undo:
+            # Next edit starts new change
+            self._undo[-1] = self._undo[-1]._replace(time=float('-inf'))
+        return change
+
+    def redo(self):
+        # Returns change to apply again, None if nothing was undone
+        if not self._redo:
+            return None
+        change = self._redo.pop()
+        self._undo.append(change._replace(time=float('-inf')))
+        return change
+
+    def forget(self, key):
+        # Removes changes of key, e.g. when its value is reloaded from file
+        self._undo = deque((c for c in self._undo if c.key != key), maxlen=self._undo.maxlen)
+        self._redo = [c for c in self._redo if c.key != key]
+
+    def clear(self):
+        self._undo.clear()
+        self._redo.clear()
+
+    @property
+    def can_undo(self):
+        return bool(self._undo)
+
+    @property
+    def can_redo(self):
+        return bool(self._redo)
+
+    def __len__(self):
+        return len(self._undo)
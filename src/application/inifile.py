@@ -0,0 +1,183 @@
+#!/usr/bin/python3
+
+import os
+import re
+import stat
+import tempfile
+
+
+__all__ = ['IniFile', 'write_atomic']
+
+SECTION_RE = re.compile(r'^\s*\[([^\]]+)\]\s*$')
+OPTION_RE = re.compile(r'^\s*([^#;=\s][^=]*?)\s*=\s*(.*?)\s*$')
+COMMENTED_OPTION_RE = re.compile(r'^\s*[#;]\s*([A-Za-z0-9_-]+)\s*=\s*(.*?)\s*$')
+# Lines with their '\n' or '\r\n' endings, last line may have no ending
+LINE_RE = re.compile(r'[^\n]*\n|[^\n]+')
+
+def split_ending(line):
+    content = line.rstrip('\r\n')
+    return content, line[len(content):]
+
+def write_atomic(path, data):
+    # Writes bytes to temporary file in the same directory, fsync, rename; mode and owner of existing file are kept.
+    # Temporary file is removed on errors. Returns number of bytes written
+    path = os.path.realpath(path)
+    directory = os.path.dirname(path)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix='.{}.'.format(os.path.basename(path)))
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            os.chmod(tmp, 0o644)
+        else:
+            os.chmod(tmp, stat.S_IMODE(st.st_mode))
+            try:
+                os.chown(tmp, st.st_uid, st.st_gid)
+            except PermissionError:
+                pass
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+    dirfd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(dirfd)
+    finally:
+        os.close(dirfd)
+    return len(data)
+
+class IniFile:
+    # Line-level model of ini file: comments and formatting are kept,
+    # set() and remove_option() change only lines of affected options.
+    # Values are raw strings (no interpolation), like GKeyFile reads them.
+    # Line endings are kept, new lines use ending of the first line.
+
+    def __init__(self, text=''):
+        self._lines = LINE_RE.findall(text)
+        self._newline = next((split_ending(line)[1] for line in self._lines if line.endswith('\n')), '\n')
+        self._modified = False
+        self._index()
+
+    @classmethod
+    def read(cls, path, missing_ok=True):
+        # Missing file is read as empty one if missing_ok, otherwise FileNotFoundError is raised
+        try:
+            with open(path, newline='') as file:
+                return cls(file.read())
+        except FileNotFoundError:
+            if not missing_ok:
+                raise
+            return cls()
+
+    def _index(self):
+        # section -> [first line, end line], (section, key) -> line, commented (section, key) -> line
+        self._sections = {}
+        self._options = {}
+        self._commented = {}
+        section = None
+        for i, line in enumerate(self._lines):
+            line = split_ending(line)[0]
+            match = SECTION_RE.match(line)
+            if match:
+                section = match.group(1).strip()
+                self._sections.setdefault(section, [i, i + 1])
+                continue
+            if section is None:
+                continue
+            self._sections[section][1] = i + 1
+            match = OPTION_RE.match(line)
+            if match:
+                self._options[section, match.group(1)] = i
+                continue
+            match = COMMENTED_OPTION_RE.match(line)
+            if match:
+                self._commented.setdefault((section, match.group(1)), i)
+
+    @property
+    def modified(self):
+        return self._modified
+
+    def sections(self):
+        return list(self._sections)
+
+    def has_section(self, section):
+        return section in self._sections
+
+    def has_option(self, section, key):
+        return (section, key) in self._options
+
+    def options(self, section):
+        return [key for s, key in self._options if s == section]
+
+    def get(self, section, key, fallback=None):
+        i = self._options.get((section, key))
+        return fallback if i is None else OPTION_RE.match(split_ending(self._lines[i])[0]).group(2)
+
+    def line(self, section, key):
+        # 1-based line number of option, None if it is not set
+        i = self._options.get((section, key))
+        return None if i is None else i + 1
+
+    def items(self, section):
+        return [(key, self.get(section, key)) for key in self.options(section)]
+
+    def set(self, section, key, value):
+        # Returns True if file was changed
+        value = str(value)
+        line = '{}={}'.format(key, value)
+        i = self._options.get((section, key))
+        if i is not None:
+            if self.get(section, key) == value:
+                return False
+            self._lines[i] = line + split_ending(self._lines[i])[1]
+        elif (section, key) in self._commented:
+            # Uncomment documented default
+            i = self._commented[section, key]
+            self._lines[i] = line + split_ending(self._lines[i])[1]
+            self._index()
+        elif section in self._sections:
+            keys = [n for (s, k), n in self._options.items() if s == section]
+            i = max(keys) + 1 if keys else self._sections[section][0] + 1
+            self._end_line(i - 1)
+            self._lines.insert(i, line + self._newline)
+            self._index()
+        else:
+            if self._lines:
+                self._end_line(len(self._lines) - 1)
+                if self._lines[-1].strip():
+                    self._lines.append(self._newline)
+            self._lines.extend(('[{}]'.format(section) + self._newline, line + self._newline))
+            self._index()
+        self._modified = True
+        return True
+
+    def _end_line(self, i):
+        # Adds ending to last line of file without one
+        if not self._lines[i].endswith('\n'):
+            self._lines[i] += self._newline
+
+    def remove_option(self, section, key):
+        # Comments option line out, returns True if file was changed
+        i = self._options.get((section, key))
+        if i is None:
+            return False
+        self._lines[i] = '#' + self._lines[i].lstrip()
+        self._index()
+        self._modified = True
+        return True
+
+    def text(self):
+        return ''.join(self._lines)
+
+    def write(self, path):
+        # Atomic write, returns number of bytes written
+        size = write_atomic(path, self.text().encode())
+        self._modified = False
+        return size
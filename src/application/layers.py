@@ -0,0 +1,136 @@
+#!/usr/bin/python3
+
+import glob
+import os
+
+from . import cache
+from .inifile import IniFile
+
+
+__all__ = ['LayeredConfig', 'layer_paths']
+
+SYSTEM_DIRS = ('/usr/share/lightdm/lightdm.conf.d',)
+
+def conf_dirs(lightdm_config, system_dirs=None):
+    # SYSTEM_DIRS are used if system_dirs is None
+    return list(SYSTEM_DIRS if system_dirs is None else system_dirs) + [os.path.join(os.path.dirname(lightdm_config), 'lightdm.conf.d')]
+
+def layer_paths(lightdm_config, greeter_config, system_dirs=None):
+    # Configuration files in order of increasing priority: conf.d directories, lightdm.conf, greeter config
+    paths = [path for directory in conf_dirs(lightdm_config, system_dirs)
+             for path in sorted(glob.glob(os.path.join(directory, '*.conf')))]
+    return paths + [lightdm_config, greeter_config]
+
+def stat_key(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_mtime_ns, st.st_size]
+
+class Layer:
+    # Configuration file, it is parsed only if its items are not cached or it is edited
+    def __init__(self, path, key, items=None):
+        self.path = path
+        self.key = key
+        self.error = None
+        self._items = items
+        self._config = None
+
+    @property
+    def name(self):
+        return os.path.basename(self.path)
+
+    @property
+    def config(self):
+        if self._config is None:
+            self._config = IniFile.read(self.path)
+        return self._config
+
+    @property
+    def items(self):
+        # [(section, key, value)], unreadable file has no items
+        if self._items is None:
+            try:
+                config = self.config
+            except (OSError, UnicodeDecodeError) as e:
+                self.error = e
+                self._items = []
+            else:
+                self._items = [(section, key, value) for section in config.sections()
+                               for key, value in config.items(section)]
+        return self._items
+
+class LayeredConfig:
+    # Effective values of all layers, later layers override earlier ones.
+    # Items of unchanged files are taken from memory or disk cache, keyed by mtime and size
+
+    CACHE = 'layers.json'
+    CACHE_VERSION = 1
+
+    def __init__(self, lightdm_config, greeter_config, system_dirs=None):
+        self._lightdm_config = lightdm_config
+        self._greeter_config = greeter_config
+        self._system_dirs = system_dirs
+        self.layers = []
+        # (section, key) -> (value, layer index)
+        self._values = {}
+        self.reload()
+
+    def reload(self):
+        # Rereads changed layers, returns set of (section, key) with changed effective values
+        current = {layer.path: layer for layer in self.layers}
+        cached = None
+        parsed = False
+        layers = []
+        for path in layer_paths(self._lightdm_config, self._greeter_config, self._system_dirs):
+            key = stat_key(path)
+            layer = current.get(path)
+            if not layer or layer.key != key:
+                if cached is None:
+                    cached = cache.load(self.CACHE, self.CACHE_VERSION) or {}
+                entry = cached.get(path)
+                items = [tuple(item) for item in entry[1]] if key and entry and entry[0] == key else None
+                parsed |= items is None
+                layer = Layer(path, key, items)
+            layers.append(layer)
+
+        values = {}
+        for index, layer in enumerate(layers):
+            values.update(((section, key), (value, index)) for section, key, value in layer.items)
+        if parsed:
+            cache.store(self.CACHE, self.CACHE_VERSION,
+                        {layer.path: [layer.key, layer.items] for layer in layers if layer.key and not layer.error})
+
+        changed = {path for path in values.keys() | self._values.keys()
+                   if values.get(path, (None,))[0] != self._values.get(path, (None,))[0]}
+        self.layers = layers
+        self._values = values
+        return changed
+
+    def dirs(self):
+        return conf_dirs(self._lightdm_config, self._system_dirs)
+
+    def layer(self, path):
+        # Layer by path or file name, None if there is no such layer
+        return next((layer for layer in reversed(self.layers) if path in (layer.path, layer.name)), None)
+
+    def has_option(self, section, key):
+        return (section, key) in self._values
+
+    def get(self, section, key, fallback=None):
+        return self._values[section, key][0] if (section, key) in self._values else fallback
+
+    def source(self, section, key):
+        # Layer which sets effective value, None if option is not set
+        return self.layers[self._values[section, key][1]] if (section, key) in self._values else None
+
+    def overriding(self, layer, section, key):
+        # Layers with higher priority than given one which set option
+        index = self.layers.index(layer)
+        return [other for other in self.layers[index + 1:] if any(item[:2] == (section, key) for item in other.items)]
+
+    def others(self, layer, section, key):
+        # Layers except given one which set option
+        return [other for other in self.layers
+                if other is not layer and any(item[:2] == (section, key) for item in other.items)]
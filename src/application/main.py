@@ -1,12 +1,19 @@
 #!/usr/bin/python3
 
 import argparse
-import configparser
 import os
+import sys
+import threading
+import time
 
-from collections import namedtuple, Mapping
-from itertools import chain, islice
-from gi.repository import Gdk, Pango
+from collections import namedtuple
+from contextlib import contextmanager
+
+from . import batch, catalog, exchange, preflight, profiles, schema, search, trace, validate
+from .history import History
+from .layers import LayeredConfig
+from .inifile import IniFile
+from .schema import OPTIONS, to_bool
 
 import gettext
 import locale
@@ -15,11 +22,12 @@ _ = gettext.gettext
 
 __all__ = ['main']
 
-def to_bool(s):
-    return s.lower() in {'1', 'true', 'yes', 'on', 'enabled'} if type(s) is str else bool(s)
-
 BindingTuple = namedtuple('BindingTuple', ('widget', 'signal', 'handler', 'change'))
 
+# Style of labels of changed options
+CHANGED_OPTION_CLASS = 'changed-option'
+CHANGED_OPTION_CSS = b'.changed-option { font-weight: bold; }'
+
 def block_signals(widgets, f, *args, **kwargs):
     for widget, signal, handler, block in widgets:  # @UnusedVariable
         if block: widget.handler_block_by_func(handler)
@@ -31,7 +39,7 @@ def block_signals(widgets, f, *args, **kwargs):
 def block_default_signals(f):
     def _block_signals(self, *args, **kwargs):
         return block_signals(self._signals, f, self, *args, **kwargs) \
-               if hasattr(self, '_signals') else f(self, *args, **kwargs)
+               if hasattr(self, '_signals') and not self._blocked else f(self, *args, **kwargs)
     return _block_signals
 
 class OptionWrapper:
@@ -40,6 +48,8 @@ class OptionWrapper:
     # WidgetsBinding: list of BindingTuple-like items, where widget and handler are names, not objects
     #                 >>> self._signals: list of BindingTuple with corresponded objects
 
+    _blocked = False
+
     def __init__(self, default, widgets, prefs):
         self._changed = False
         self._enabled = True
@@ -47,6 +57,9 @@ class OptionWrapper:
         self._widgets = widgets
         self._default = default
         self._prefs = prefs
+        self._listeners = []
+        # (section, key), set by Application
+        self.path = ()
         if hasattr(self, 'WidgetsTuple'):
             self._widget = self.WidgetsTuple._make(widgets.get(field, None) for field in self.WidgetsTuple._fields)
         else:
@@ -69,25 +82,56 @@ class OptionWrapper:
     def _on_label_toggled(self, widget):
         self._set_enabled(self._label.props.active, True)
         self.touch()
+    def _blockable_signals(self):
+        signals = tuple(s for s in getattr(self, '_signals', ()) if s.change)
+        return signals + ((BindingTuple(self._label, 'toggled', self._on_label_toggled, True),) if self._label else ())
+    def block(self):
+        # Blocks handlers until unblock(), value and state are set without blocking them on every change
+        for widget, signal, handler, block in self._blockable_signals():  # @UnusedVariable
+            widget.handler_block_by_func(handler)
+        self._blocked = True
+    def unblock(self):
+        self._blocked = False
+        for widget, signal, handler, block in self._blockable_signals():  # @UnusedVariable
+            widget.handler_unblock_by_func(handler)
+    def _set_label_changed(self, changed):
+        if self._label:
+            context = self._label.get_style_context()
+            if changed:
+                context.add_class(CHANGED_OPTION_CLASS)
+            else:
+                context.remove_class(CHANGED_OPTION_CLASS)
     def reset(self):
         self.value = self._default
         self._changed = False
-        if self._label:
-            self._label.modify_font(Pango.FontDescription('normal'))
+        self._set_label_changed(False)
     def touch(self):
         self._changed = True
-        if self._label:
-            self._label.modify_font(Pango.FontDescription('bold'))
+        self._set_label_changed(True)
+        for callback in self._listeners:
+            callback(self)
+    def add_listener(self, callback):
+        # callback(option) is called when option is changed by user
+        self._listeners.append(callback)
     def _get_widget_value(self):
         raise NotImplementedError()
     def _set_widget_value(self, value):
         raise NotImplementedError()
+    def _absolute_path(self, value):
+        # Relative paths are relative to 'current_dir' pref
+        return value if os.path.isabs(value) else os.path.abspath(os.path.join(self._prefs.get('current_dir', ''), value))
+    def _relative_path(self, filename):
+        relative = os.path.relpath(filename, self._prefs.get('current_dir', ''))
+        return filename if relative.startswith('..') else relative
     def _set_enabled(self, value, block=False):
         self._enabled = value
         for w in filter(lambda w: isinstance(w, Gtk.Widget), self._widgets.values()):
             w.props.sensitive = value
         if not block and self._label:
-            block_signals(((self._label, '', self._on_label_toggled, True),), self.label.set_active, value)
+            if self._blocked:
+                self._label.set_active(value)
+            else:
+                block_signals(((self._label, '', self._on_label_toggled, True),), self.label.set_active, value)
     @property
     def value(self):
         return self._get_widget_value()
@@ -105,6 +149,9 @@ class OptionWrapper:
     def changed(self):
         return self._changed
     @property
+    def blocked(self):
+        return self._blocked
+    @property
     def enabled(self):
         return self._enabled
     @enabled.setter
@@ -113,6 +160,17 @@ class OptionWrapper:
     @property
     def label(self):
         return self._label
+    @property
+    def state(self):
+        # (enabled, changed, value), raises ValueError for invalid widget value
+        return self._enabled, self._changed, self.value
+    def restore(self, state):
+        # Sets state without notifying listeners
+        enabled, changed, value = state
+        self.value = value
+        self.enabled = enabled
+        self._changed = changed
+        self._set_label_changed(changed)
 
 
 class BooleanOption(OptionWrapper):
@@ -143,18 +201,13 @@ class IntegerOption(StringOption):
         return int(super()._get_widget_value())
 
 class ChoiceOption(OptionWrapper):
-    def __init__(self, *args):
-        super().__init__(*args)
-        self._choices = {int(name.partition('_')[-1]): widget
-                         for (name, widget) in self._widgets.items() if name.starts_with('choice_')}
-        if not self._choices:
-            self._choices = self._widget
-    def _bind(self):
-        super()._bind()
+    # Gtk.ComboBox with item ids as values
+    WidgetsBinding = ('', 'changed', ''),
     def _set_widget_value(self, value):
-        raise NotImplementedError()
+        if not self._widget.set_active_id(value):
+            self._widget.props.active = -1
     def _get_widget_value(self):
-        raise NotImplementedError()
+        return self._widget.get_active_id() or ''
 
 class FontOption(OptionWrapper):
     WidgetsBinding = ('', 'font-set', ''),
@@ -169,16 +222,13 @@ class PathOption(OptionWrapper):
         if not value:
             self._widget.unselect_all()
         else:
-            if not os.path.isabs(value):
-                value = os.path.abspath(os.path.join(self._prefs.get('current_dir', ''), value))
-            self._widget.select_filename(value)
+            self._widget.select_filename(self._absolute_path(value))
     def _get_widget_value(self):
         filename = self._widget.get_filename()
-        relative = os.path.relpath(filename, self._prefs.get('current_dir', ''))
-        return filename if relative.startswith('..') else relative
+        return self._relative_path(filename) if filename else ''
 
 class BackgroundOption(OptionWrapper):
-    WidgetsTuple = namedtuple('WidgetsTuple', ('file', 'color', 'is_file', 'is_color'))
+    WidgetsTuple = namedtuple('WidgetsTuple', schema.Background.fields)
     WidgetsBinding = ('file', 'file-set', '_on_file_changed'), ('color', 'color-set', '_on_color_changed'), ('is_file', 'toggled', ''),
     def _set_widget_value(self, value):
         is_file = not value.startswith('#')
@@ -187,6 +237,8 @@ class BackgroundOption(OptionWrapper):
         if not value or not is_file:
             self._widget.file.unselect_all()
         if is_file:
+            if value:
+                value = self._absolute_path(value)
             self._widget.file.select_filename(value)
         else:
             try:
@@ -199,45 +251,66 @@ class BackgroundOption(OptionWrapper):
                 pass
             else:
                 self._widget.color.props.color = color
+        self._update_preview(value if is_file else None)
     def _get_widget_value(self):
         if self._widget.is_file.props.active:
-            return self._widget.file.get_filename()
+            filename = self._widget.file.get_filename()
+            return self._relative_path(filename) if filename else filename
         else:
             return self._widget.color.props.color.to_string()
+    def _update_preview(self, filename):
+        preview = self._widgets.get('preview')
+        if not preview:
+            pass
+        elif self._widget.is_file.props.active:
+            thumbnails.show(preview, filename)
+        else:
+            thumbnails.show_color(preview, self._widget.color.props.color)
+    def _on_change(self, *args):
+        super()._on_change()
+        self._update_preview(self._widget.file.get_filename())
     def _on_color_changed(self, *args):
         self._widget.is_color.props.active = True
-        self.touch()
+        self._on_change()
     def _on_file_changed(self, *args):
         self._widget.is_file.props.active = True
-        self.touch()
+        self._on_change()
 
 class IconOption(OptionWrapper):
-    WidgetsTuple = namedtuple('WidgetsTuple', ('file', 'icon', 'is_file', 'is_icon'))
-    WidgetsBinding = ('file', 'file-set', '_on_file_changed'), ('icon', 'changed', '_on_icon_changed'), ('is_file', 'toggled', ''),
+    WidgetsTuple = namedtuple('WidgetsTuple', schema.Icon.fields)
+    WidgetsBinding = ('file', 'file-set', '_on_file_changed'), ('icon', 'changed', '_on_icon_changed', True), ('is_file', 'toggled', ''),
     def _set_widget_value(self, value):
         is_file = not value.startswith('#')
         self._widget.is_file.props.active = is_file
         self._widget.is_icon.props.active = not is_file
         if not value or not is_file:
             self._widget.file.unselect_all()
-        if is_file:
-            self._widget.file.select_filename(value)
-        else:
+        if is_file and value:
+            self._widget.file.select_filename(self._absolute_path(value))
+        elif not is_file:
             self._widget.icon.props.text = value[1:]
+        self._update_preview(value)
     def _get_widget_value(self):
         if self._widget.is_file.props.active:
-            return self._widget.file.get_filename()
+            filename = self._widget.file.get_filename()
+            return self._relative_path(filename) if filename else filename
         else:
             return ('#' + self._widget.icon.props.text) if self._widget.icon.props.text else ''
+    def _update_preview(self, value):
+        if self._widgets.get('preview'):
+            thumbnails.show(self._widgets['preview'], self._absolute_path(value) if value and value[0] != '#' else value)
+    def _on_change(self, *args):
+        super()._on_change()
+        self._update_preview(self.value)
     def _on_icon_changed(self, *args):
         self._widget.is_icon.props.active = True
-        self.touch()
+        self._on_change()
     def _on_file_changed(self, *args):
         self._widget.is_file.props.active = True
-        self.touch()
+        self._on_change()
 
 class FontScaleOption(OptionWrapper):
-    WidgetsTuple = namedtuple('WidgetsTuple', ('scale', 'use', 'disabled'))
+    WidgetsTuple = namedtuple('WidgetsTuple', schema.FontScale.fields)
     WidgetsBinding = ('use', 'toggled', ''), ('scale', 'changed', '',)
     def _set_widget_value(self, value):
         self._widget.use.props.active = bool(value)
@@ -248,7 +321,7 @@ class FontScaleOption(OptionWrapper):
         return float(self._widget.scale.props.text) if self._widget.use.props.active else ''
 
 class OSKOption(OptionWrapper):
-    WidgetsTuple = namedtuple('WidgetsTuple', ('use_onboard', 'use_command', 'command'))
+    WidgetsTuple = namedtuple('WidgetsTuple', schema.OSK.fields)
     WidgetsBinding = ('use_onboard', 'toggled', ''), ('command', 'changed', '',)
     def _set_widget_value(self, value):
         use_onboard = value == '#onboard'
@@ -265,7 +338,7 @@ class IndicatorOption(OptionWrapper):
         ENABLED = 3
         INCONSISTENT = 4
         PAGE = 5
-    WidgetsBinding = ('', 'row-changed', '_on_row_changed'), ('toggle', 'toggled', '_on_toggled')
+    WidgetsBinding = ('', 'row-changed', '_on_row_changed', True), ('toggle', 'toggled', '_on_toggled')
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self._row = next(row for row in self._widget
@@ -293,108 +366,108 @@ class IndicatorOption(OptionWrapper):
         return int(self._row[self.Model.ENABLED])
 
 
-INDICATOR_WIDGETS = {'': '/indicators_model', 'toggle': '/indicators_renderer_toggle'}
-
-class OPTION_INDEX:
-    DEFAULT = 1
-
-OPTIONS = \
-{
-    # 'section': {'key': (OptionWrapperClass, default_value, widgets, preferences), ...}
-    'appearance': \
-    {
-        'theme-name': (StringOption, 'default'),
-        'icon-theme-name': (StringOption, 'default'),
-        'background': (BackgroundOption, ''),
-        'ui-file': (PathOption, '', (), {'current_dir': '{greeter-data}'}),
-        'css-file': (PathOption, '', (), {'current_dir': '{greeter-data}'}),
-        'logo': (IconOption, ''),
-        'font-name': (FontOption, ''),
-        # 'fixed-user-image-size': (BooleanOption, True),
-        # 'list-view-image-size': (IntegerOption, 48),
-        'xft-dpi': (IntegerOption, 96),
-        'date-format': (StringOption, '')
-    },
-    'greeter': \
-    {
-        'allow-other-users': (BooleanOption, False),
-        'show-language-selector': (BooleanOption, True),
-        'show-session-icon': (BooleanOption, False),
-    },
-    'panel': \
-    {
-        'show-panel': (BooleanOption, True),
-        'panel-at-top': (BooleanOption, True, ('panel-at-bottom',)),
-    },
-    'clock': \
-    {
-        'enabled': (IndicatorOption, True, INDICATOR_WIDGETS, {'page': 'clock'}),
-        'date-format': (StringOption, ''),
-        'time-format': (StringOption, ''),
-        'show-calendar': (BooleanOption, True),
-    },
-    'layout': \
-    {
-        'enabled': (IndicatorOption, True, INDICATOR_WIDGETS, {'page': 'layout'}),
-    },
-    'power': \
-    {
-        'enabled': (IndicatorOption, True, INDICATOR_WIDGETS, {'page': 'power'}),
-        'suspend-prompt': (BooleanOption, True),
-        'hibernate-prompt': (BooleanOption, True),
-        'restart-prompt': (BooleanOption, True),
-        'shutdown-prompt': (BooleanOption, True),
-    },
-    'a11y': \
-    {
-        'enabled': (IndicatorOption, False, INDICATOR_WIDGETS, {'page': 'a11y'}),
-        'theme-name-contrast': (StringOption, ''),
-        'icon-theme-name-contrast': (StringOption, ''),
-        'font-scale': (FontScaleOption, '1.2'),
-        'osk': (OSKOption, '#onboard'),
-    }
-}
+WRAPPERS = {schema.Boolean: BooleanOption, schema.String: StringOption, schema.Integer: IntegerOption,
+            schema.Choice: ChoiceOption, schema.Font: FontOption, schema.Path: PathOption,
+            schema.Background: BackgroundOption, schema.Icon: IconOption, schema.FontScale: FontScaleOption,
+            schema.OSK: OSKOption, schema.Indicator: IndicatorOption}
+
+class StartupProfile:
+    def __init__(self):
+        self._last = time.perf_counter()
+        self._phases = []
+    def mark(self, phase):
+        now = time.perf_counter()
+        self._phases.append((phase, now - self._last))
+        self._last = now
+    def report(self, file=sys.stderr):
+        for phase, duration in self._phases:
+            print('{:<20}{:>10.1f} ms'.format(phase, duration * 1000), file=file)
+        print('{:<20}{:>10.1f} ms'.format('total', sum(d for p, d in self._phases) * 1000), file=file)
 
 class Application:
     OptionPath = namedtuple('OptionPath', ('section', 'key'))
-    def __init__(self, prefs):
+    # Objects loaded on startup, other notebook pages are loaded on first switch
+    STARTUP_OBJECTS = ('main_window', 'label_menu', 'adjustment1')
+    # Placeholder page name -> objects to load
+    DEFERRED_PAGES = {'page_greeter': ('grid2',),
+                      'page_indicators': ('box2', 'indicators_model', 'a11y_font-scale_adjustment')}
+    GENERATED_PAGE = 'page_advanced'
+    PREVIEW_OPTIONS = {('appearance', key) for key in ('theme-name', 'font-name', 'xft-dpi', 'background', 'ui-file', 'css-file')}
+    def __init__(self, prefs, profile=None):
         if not prefs['greeter-config-output']:
             prefs['greeter-config-output'] = prefs['greeter-config']
         if not os.path.isabs(prefs['ui-file']):
             prefs['ui-file'] = os.path.join(os.path.abspath(os.curdir), prefs['ui-file'])
         self.prefs = prefs
+        self.profile = profile
         self.config = None
+        self.layers = None
+        self.preview = None
+        self.profiles = None
+        self.preflight = None
+        self.history = History()
+        # Option -> last known state, old state for history
+        self.states = {}
+        self.catalogs = {name: Gtk.ListStore(str) for name in catalog.CATALOGS}
+        threading.Thread(target=lambda: GLib.idle_add(self._on_catalogs_loaded, catalog.get_catalogs()), daemon=True).start()
         self.gui = self.create_gui()
+        if self.profile:
+            self.profile.mark('builder load')
 
         # Option -> (section, key)
-        self.options = {self.create_option(section, key, args): self.OptionPath(section, key)
-                        for section, keys in OPTIONS.items()
-                            for key, args in keys.items()}
+        self.options = {}
+        # (section, key) -> schema.Binding, for options with not yet loaded widgets
+        self.index = schema.get_index(self.prefs['ui-file'])
+        self.pending_options = {self.OptionPath(*path): binding
+                                for path, binding in self.index.items() if binding.available}
+        self.loaded_objects = set(self.STARTUP_OBJECTS)
+        self.deferred_pages = dict(self.DEFERRED_PAGES)
+        # Options without widgets in ui-file, their widgets are created with GENERATED_PAGE
+        self.generated = schema.generated_options(self.index)
+        self.create_options()
+        if self.profile:
+            self.profile.mark('option creation')
 
         self.__dict__.update((name, self.gui[name]) for name in
-                             ('main_window', 'label_menu', 'label_menu_reset',
-                              'indicators_model', 'indicators_selection', 'indicators_notebook'))
-
-        for row in self.indicators_model:
-            page = self.gui['indicator_page_{name}'.format(name=row[IndicatorOption.Model.NAME])]
-            row[IndicatorOption.Model.PAGE] = self.indicators_notebook.page_num(page) if page else 0
-        self.indicators_selection.select_path('0')
-
-    def create_option(self, section, key, args):
-        klass, default, widgets_names, prefs = chain(args, islice((None, None, (), {}), len(args), None))
-
-        widgets = {'': '', 'label': 'label'}
-        if hasattr(klass, 'WidgetsTuple'):
-            widgets.update((name, name) for name in klass.WidgetsTuple._fields)
-        if isinstance(widgets_names, Mapping):
-            widgets.update(widgets_names)
-        elif widgets_names:
-            widgets.update((name.lstrip('/'), name) for name in widgets_names)
-        widgets = {name: self.gui['_'.join(filter(None, (section, key, widget)))]
-                         if not widget.startswith('/') else self.gui[widget[1:]]
-                         for name, widget in widgets.items()}
-        prefs.update((k, v.format_map(self.prefs)) for k, v in prefs.items() if type(v) is str)
-        option = klass(default, widgets, prefs)
+                             ('main_window', 'label_menu', 'label_menu_reset', 'notebook1'))
+        self.notebook1.connect('switch-page', self._on_page_switched)
+        if not self.gui[self.GENERATED_PAGE]:
+            self.generated = []
+        elif not self.generated:
+            self.gui[self.GENERATED_PAGE].hide()
+        self.main_window.connect('key-press-event', self._on_key_press)
+
+        # Search index is built on first search
+        self.search_index = None
+        self.search_model = Gtk.ListStore(str, str, str)
+        completion = Gtk.EntryCompletion(model=self.search_model, text_column=0)
+        completion.set_match_func(lambda *args: True, None)
+        completion.connect('match-selected', self._on_search_match_selected)
+        self.gui['search_entry'].set_completion(completion)
+
+    def create_options(self):
+        created = {}
+        for path, binding in list(self.pending_options.items()):
+            if binding.objects <= self.loaded_objects:
+                created[self.create_option(path, binding)] = path
+                del self.pending_options[path]
+        self.options.update(created)
+        if self.config is not None:
+            self.load_options(created)
+
+    def create_option(self, path, binding):
+        widgets = {name: self.gui[id] if id else None for name, id in binding.widgets.items()}
+        return self.wrap_option(path, widgets)
+
+    def wrap_option(self, path, widgets):
+        spec = OPTIONS[path.section][path.key]
+        prefs = schema.option_prefs(spec, self.prefs)
+        option = WRAPPERS[type(spec.type)](spec.default, widgets, prefs)
+        option.path = path
+        option.add_listener(self._on_option_touched)
+        if 'catalog' in prefs:
+            widgets[''].set_completion(Gtk.EntryCompletion(model=self.catalogs[prefs['catalog']], text_column=0,
+                                                           inline_completion=True))
         if option.label:
             option.label.connect('button-press-event', self._on_label_click, option)
         return option
@@ -403,51 +476,391 @@ class Application:
         builder = Gtk.Builder()
         if 'localedomain' in self.prefs:
             builder.set_translation_domain(self.prefs['localedomain'])
-        builder.add_from_file(self.prefs['ui-file'])
+        builder.add_objects_from_file(self.prefs['ui-file'], self.STARTUP_OBJECTS)
         builder.connect_signals(self)
+        css = Gtk.CssProvider()
+        css.load_from_data(CHANGED_OPTION_CSS)
+        Gtk.StyleContext.add_provider_for_screen(Gdk.Screen.get_default(), css, Gtk.STYLE_PROVIDER_PRIORITY_APPLICATION)
         class BuilderWrapper:
-            def __init__(self, builder):
+            def __init__(self, builder, filename, handlers):
                 self._builder = builder
+                self._filename = filename
+                self._handlers = handlers
             def __getitem__(self, key):
                 return self._builder.get_object(key)
-        return BuilderWrapper(builder)
+            def add_objects(self, names):
+                self._builder.add_objects_from_file(self._filename, names)
+                self._builder.connect_signals(self._handlers)
+        return BuilderWrapper(builder, self.prefs['ui-file'], self)
+
+    def load_page(self, name):
+        if name == self.GENERATED_PAGE:
+            return self.create_generated_page()
+        objects = self.deferred_pages.pop(name, None)
+        if not objects:
+            return
+        self.gui.add_objects(objects)
+        self.loaded_objects.update(objects)
+        self.gui[name].add(self.gui[objects[0]])
+        if 'indicators_model' in objects:
+            self.__dict__.update((attr, self.gui[attr]) for attr in
+                                 ('indicators_model', 'indicators_selection', 'indicators_notebook'))
+            for row in self.indicators_model:
+                page = self.gui['indicator_page_{name}'.format(name=row[IndicatorOption.Model.NAME])]
+                row[IndicatorOption.Model.PAGE] = self.indicators_notebook.page_num(page) if page else 0
+            self.indicators_selection.select_path('0')
+        self.create_options()
+
+    def load_all_pages(self):
+        for page in list(self.deferred_pages) + [self.GENERATED_PAGE]:
+            self.load_page(page)
+
+    def create_generated_page(self):
+        if not self.generated:
+            return
+        grid = Gtk.Grid(row_spacing=12, column_spacing=5, margin=12, valign=Gtk.Align.START)
+        created = {}
+        for row, (section, key) in enumerate(self.generated):
+            label = Gtk.ToggleButton(label=schema.option_label(key), relief=Gtk.ReliefStyle.NONE, xalign=0)
+            widget = self.create_widget(OPTIONS[section][key].type)
+            grid.attach(label, 0, row, 1, 1)
+            grid.attach(widget, 1, row, 1, 1)
+            path = self.OptionPath(section, key)
+            created[self.wrap_option(path, {'': widget, 'label': label})] = path
+        self.generated = []
+        scrolled = Gtk.ScrolledWindow(hscrollbar_policy=Gtk.PolicyType.NEVER)
+        scrolled.add(grid)
+        scrolled.show_all()
+        self.gui[self.GENERATED_PAGE].pack_start(scrolled, True, True, 0)
+        self.options.update(created)
+        if self.config is not None:
+            self.load_options(created)
+
+    def create_widget(self, value_type):
+        # Editor for generic option type
+        if isinstance(value_type, schema.Boolean):
+            return Gtk.Switch(halign=Gtk.Align.START)
+        if isinstance(value_type, schema.Integer):
+            lower = -2 ** 31 if value_type.minimum is None else value_type.minimum
+            upper = 2 ** 31 - 1 if value_type.maximum is None else value_type.maximum
+            widget = Gtk.SpinButton.new_with_range(lower, upper, 1)
+            widget.props.halign = Gtk.Align.START
+            return widget
+        if isinstance(value_type, schema.Choice):
+            widget = Gtk.ComboBoxText(halign=Gtk.Align.START)
+            for choice in value_type.choices:
+                widget.append(choice, choice)
+            return widget
+        if isinstance(value_type, schema.Font):
+            return Gtk.FontButton(hexpand=True)
+        if isinstance(value_type, schema.Path):
+            return Gtk.FileChooserButton(hexpand=True)
+        return Gtk.Entry(hexpand=True)
 
     def run(self):
         self.read()
+        if self.profile:
+            self.profile.mark('read')
+            self._first_frame_handler = self.main_window.connect_after('draw', self._on_first_frame)
+        if self.prefs['watch']:
+            self.watch()
         Gtk.main()
 
+    def watch(self):
+        # conf.d directories are watched for added and removed layers
+        paths = self.layers.dirs() + [self.prefs['lightdm-config'], self.prefs['greeter-config'], self.target.path]
+        self.monitors = [Gio.File.new_for_path(path).monitor(Gio.FileMonitorFlags.NONE, None) for path in set(paths)]
+        for monitor in self.monitors:
+            monitor.connect('changed', self._on_config_file_changed)
+
     def read(self):
-        self.config = configparser.ConfigParser(allow_no_value=True)
+        self.layers = LayeredConfig(self.prefs['lightdm-config'], self.prefs['greeter-config'])
+        self.target = self.layers.layer(self.prefs['save-layer'] or self.prefs['greeter-config'])
+        if not self.target:
+            self.show_error(_('Configuration file is not a layer of lightdm configuration: {}').format(self.prefs['save-layer']))
+            self.target = self.layers.layer(self.prefs['greeter-config'])
+        self.read_target()
+        errors = [layer for layer in self.layers.layers if layer.error and layer is not self.target]
+        if errors:
+            self.show_error('\n'.join('{}: {}'.format(layer.path, layer.error) for layer in errors))
+        self.load_options(self.options)
+
+    def read_target(self):
         try:
-            self.config.read(self.prefs['greeter-config'])
-        except configparser.Error as e:
+            self.config = self.target.config
+        except (OSError, UnicodeDecodeError) as e:
+            self.config = IniFile()
             self.show_error(e)
 
+    def reload_layers(self):
+        # Only changed layers are parsed again, returns (section, key) of changed values
+        paths = self.layers.reload()
+        self.target = self.layers.layer(self.target.path) or self.layers.layer(self.prefs['greeter-config'])
+        self.read_target()
+        return paths
+
+    def output_path(self):
+        if self.target.path == self.prefs['greeter-config']:
+            return self.prefs['greeter-config-output']
+        return self.target.path
+
+    def load_options(self, options):
+        with self.bulk_update(options):
+            for option, (section, key) in options.items():
+                option.enabled = self.layers.has_option(section, key)
+                option.default = self.layers.get(section, key, OPTIONS[section][key].default)
+                option.reset()
+                self.show_source(option, section, key)
+                self.remember(option)
+                self.history.forget(option)
+                self.update_search(option)
+        self.update_preview()
+
+    def get_search_index(self):
+        if not self.search_index:
+            translate = None
+            if 'localedomain' in self.prefs:
+                translate = lambda text: gettext.dgettext(self.prefs['localedomain'], text)
+            self.search_index = search.SearchIndex(self.index, self.prefs['ui-file'], translate)
+            for path, value in self.snapshot().items():
+                self.search_index.update(path, value)
+        return self.search_index
+
+    def update_search(self, option):
+        if self.search_index:
+            try:
+                self.search_index.update(self.options[option], option.value if option.enabled else None)
+            except ValueError:
+                pass
+
+    def show_option(self, path):
+        # Loads page of option and makes it visible
+        binding = self.index[path]
+        for page, objects in list(self.deferred_pages.items()):
+            if binding.objects & set(objects):
+                self.load_page(page)
+        if path in self.generated:
+            self.load_page(self.GENERATED_PAGE)
+        if binding.widgets[''] == 'indicators_model':
+            widget = self.gui['indicators_notebook']
+            for row in self.indicators_model:
+                if row[IndicatorOption.Model.NAME] == path[0]:
+                    self.indicators_selection.select_iter(row.iter)
+        else:
+            option = next(option for option, option_path in self.options.items() if option_path == path)
+            widget = option.label or next(self.gui[id] for id in binding.widgets.values()
+                                          if id and isinstance(self.gui[id], Gtk.Widget))
+        child, parent = widget, widget.get_parent()
+        while parent:
+            if parent is getattr(self, 'indicators_notebook', None):
+                page = parent.page_num(child)
+                for row in self.indicators_model:
+                    if row[IndicatorOption.Model.PAGE] == page:
+                        self.indicators_selection.select_iter(row.iter)
+                        break
+            elif isinstance(parent, Gtk.Notebook):
+                parent.set_current_page(parent.page_num(child))
+            child, parent = parent, parent.get_parent()
+        widget.grab_focus()
+
+    def remember(self, option):
+        try:
+            self.states[option] = option.state
+        except ValueError:
+            self.states.pop(option, None)
+
+    def undo(self):
+        change = self.history.undo()
+        if change:
+            self.restore(change.key, change.old)
+
+    def redo(self):
+        change = self.history.redo()
+        if change:
+            self.restore(change.key, change.new)
+
+    def restore(self, option, state):
+        # Only this option is updated
+        with self.bulk_update((option,)):
+            option.restore(state)
+        self.states[option] = state
+        self.update_search(option)
+        if self.preview and self.options.get(option) in self.PREVIEW_OPTIONS:
+            self.update_preview()
+
+    def show_source(self, option, section, key):
+        if option.label:
+            layer = self.layers.source(section, key)
+            option.label.set_tooltip_text(_('Set in {}').format(layer.path) if layer else _('Not set, default value is used'))
+
+    @contextmanager
+    def bulk_update(self, options=None):
+        # Blocks handlers of options once for the whole update
+        options = [option for option in (self.options if options is None else options) if not option.blocked]
+        for option in options:
+            option.block()
+        try:
+            yield
+        finally:
+            for option in options:
+                option.unblock()
+
+    def update_preview(self):
+        if not self.preview:
+            return
+        values = {}
+        for option, (section, key) in self.options.items():
+            if (section, key) in self.PREVIEW_OPTIONS:
+                try:
+                    values[key] = str(option.value) if option.enabled else OPTIONS[section][key].default
+                except ValueError:
+                    pass
+        self.preview.update(values)
+
+    def refresh(self):
+        # Updates only options changed in file since last read, asks what to do with edited ones
+        paths = self.reload_layers()
+        changed, conflicts = {}, {}
+        for option, path in self.options.items():
+            if path in paths:
+                (conflicts if option.changed else changed)[option] = path
+        if conflicts and self.ask_conflicts(sorted('.'.join(path) for path in conflicts.values())):
+            for option, (section, key) in conflicts.items():
+                option.default = self.layers.get(section, key, OPTIONS[section][key].default)
+                self.show_source(option, section, key)
+        else:
+            changed.update(conflicts)
+        self.load_options(changed)
+
+    def ask_conflicts(self, names):
+        # Returns True to keep edited values
+        dialog = Gtk.MessageDialog(self.gui['main_window'], message_type=Gtk.MessageType.WARNING,
+                                   title=_('Configuration file changed'),
+                                   message_format=_('Configuration file was changed by another program. '
+                                                    'These options were also edited here:'))
+        dialog.format_secondary_text('\n'.join(names))
+        dialog.add_buttons(_('Use file values'), Gtk.ResponseType.REJECT, _('Keep my changes'), Gtk.ResponseType.ACCEPT)
+        response = dialog.run()
+        dialog.destroy()
+        return response == Gtk.ResponseType.ACCEPT
+
+    def ask_preflight(self, problems):
+        # Returns True to save in spite of problems with used files
+        dialog = Gtk.MessageDialog(self.gui['main_window'], message_type=Gtk.MessageType.WARNING,
+                                   title=_('Problems with greeter files'),
+                                   message_format=_('Greeter may not be able to use these files:'))
+        dialog.format_secondary_text('\n'.join('{}.{}: {}'.format(p.section, p.key, p.message) for p in problems))
+        dialog.add_buttons(_('Cancel'), Gtk.ResponseType.REJECT, _('Save anyway'), Gtk.ResponseType.ACCEPT)
+        response = dialog.run()
+        dialog.destroy()
+        return response == Gtk.ResponseType.ACCEPT
+
+    def diff(self):
+        # (section, key, value, value in file) for changed options, None if option is not set
+        return [(section, key, str(option.value) if option.enabled else None, self.config.get(section, key))
+                for option, (section, key) in self.options.items() if option.changed]
+
+    def validate(self):
+        # Returns messages for changed options with invalid values
+        errors = []
         for option, (section, key) in self.options.items():
-            option.enabled = self.config.has_option(section, key)
-            option.default = self.config[section][key] if option.enabled else OPTIONS[section][key][OPTION_INDEX.DEFAULT]
-            option.reset()
+            if option.changed and option.enabled:
+                try:
+                    message = validate.check_value(section, key, option.value, self.prefs)
+                except ValueError as e:
+                    message = str(e)
+                if message:
+                    errors.append('{}.{}: {}'.format(section, key, message))
+        return sorted(errors)
+
+    def check_layers(self, diff):
+        # Returns messages for changes which would be hidden by other layers
+        errors = []
+        for section, key, value, base in diff:  # @UnusedVariable
+            if value is not None:
+                layers = self.layers.overriding(self.target, section, key)
+            else:
+                layers = self.layers.others(self.target, section, key)
+            if layers:
+                errors.append('{}.{}: {}'.format(section, key, _('also set in {}').format(', '.join(l.path for l in layers))))
+        return errors
+
+    def snapshot(self):
+        # (section, key) -> current value of every option, None if it is not set
+        values = {(section, key): self.layers.get(section, key) for section in OPTIONS for key in OPTIONS[section]}
+        for option, path in self.options.items():
+            try:
+                values[path] = str(option.value) if option.enabled else None
+            except ValueError:
+                pass
+        return schema.format_values(values)
+
+    def apply_profile(self, values):
+        # Changes only options with different values, every change can be undone
+        changes = profiles.diff(self.snapshot(), schema.format_values(values))
+        if any((section, key) in self.pending_options or (section, key) in self.generated
+               for section, key, current, value in changes):
+            self.load_all_pages()
+        paths = {option_path: option for option, option_path in self.options.items()}
+        restored = []
+        for section, key, current, value in changes:
+            option = paths.get((section, key))
+            if not option:
+                continue
+            old = self.states.get(option)
+            state = (value is not None, True, value if value is not None else old[2] if old else option.default)
+            restored.append((option, old, state))
+        with self.bulk_update([option for option, old, state in restored]):
+            for option, old, state in restored:
+                option.restore(state)
+                self.states[option] = state
+                if old is not None:
+                    self.history.record(option, old, state)
+                self.update_search(option)
+        self.update_preview()
+        return len(restored)
+
+    def export_patch(self, path):
+        try:
+            IniFile(batch.format_patch(self.diff())).write(path)
+        except OSError as e:
+            self.show_error(e)
+            return False
+        return True
 
     def save(self):
-        diff = ((o, p) for o, p in self.options.items() if o.changed)
-        for option, (section, key) in diff:
-            if option.enabled:
-                if not self.config.has_section(section):
-                    self.config.add_section(section)
-                self.config.set(section, key, str(option.value))
+        errors = self.validate()
+        if errors:
+            self.show_error(_('Invalid values, configuration is not saved:') + '\n' + '\n'.join(errors))
+            return False
+        if not self.preflight:
+            self.preflight = preflight.Checker(self.prefs['lightdm-user'])
+        problems = self.preflight.check(self.snapshot(), self.prefs)
+        if problems and not self.ask_preflight(problems):
+            return False
+        if self.prefs['export-patch']:
+            return self.export_patch(self.prefs['export-patch'])
+        diff = self.diff()
+        errors = self.check_layers(diff)
+        if errors:
+            self.show_error(_('Changes would not take effect, configuration is not saved:') + '\n' + '\n'.join(errors))
+            return False
+        for section, key, value, base in diff:  # @UnusedVariable
+            if value is not None:
+                self.config.set(section, key, value)
             else:
                 self.config.remove_option(section, key)
 
-        sections_to_delete = [s for s in self.config if s != 'DEFAULT' and not self.config[s]]
-        for section in sections_to_delete:
-            del self.config[section]
-
+        if not self.config.modified and self.output_path() == self.target.path:
+            return True
         try:
-            with open(self.prefs['greeter-config-output'], mode='w') as file:
-                self.config.write(file)
+            size = self.config.write(self.output_path())
         except OSError as e:
             self.show_error(e)
             return False
+        trace.event('Application.save.write', path=self.output_path(), bytes=size, changed=len(diff))
+        # Saved values are not reported as changed by file monitor
+        self.reload_layers()
         return True
 
     def show_error(self, error):
@@ -463,9 +876,47 @@ class Application:
             self.label_menu_handler = self.label_menu_reset.connect('activate', self._on_reset_option_clicked, option)
             self.label_menu.popup(None, None, None, None, event.button, event.time)
 
+    def _on_catalogs_loaded(self, catalogs):
+        for name, items in catalogs.items():
+            for item in items:
+                self.catalogs[name].append((item,))
+        return False
+
+    def _on_option_touched(self, option):
+        old = self.states.get(option)
+        try:
+            new = self.states[option] = option.state
+        except ValueError:
+            pass  # Incomplete value, e.g. while typing a number, next valid one is recorded
+        else:
+            if old is not None:
+                self.history.record(option, old, new)
+        self.update_search(option)
+        if self.preview and self.options.get(option) in self.PREVIEW_OPTIONS:
+            self.update_preview()
+
+    def _on_search_changed(self, entry):
+        index = self.get_search_index()
+        self.search_model.clear()
+        for section, key in index.search(entry.props.text):
+            label = index.label((section, key))
+            self.search_model.append(('{} ({}.{})'.format(label, section, key) if label else '{}.{}'.format(section, key),
+                                      section, key))
+        if len(self.search_model):
+            entry.get_completion().complete()
+
+    def _on_search_activate(self, entry):
+        if len(self.search_model):
+            self.show_option(tuple(self.search_model[0][1:]))
+
+    def _on_search_match_selected(self, completion, model, it):
+        self.show_option((model[it][1], model[it][2]))
+        return True
+
     def _on_reset_option_clicked(self, widget, option):
         option.reset()
-        option.enabled = self.config.has_option(*self.options[option])
+        option.enabled = self.layers.has_option(*self.options[option])
+        self._on_option_touched(option)
 
     def _on_ok_clicked(self, *args):
         if self.save():
@@ -475,30 +926,203 @@ class Application:
         Gtk.main_quit()
 
     def _on_reset_clicked(self, *args):
-        for option, (section, key) in self.options.items():
-            option.reset()
-            option.enabled = self.config.has_option(section, key)
+        with self.bulk_update():
+            for option, (section, key) in self.options.items():
+                option.reset()
+                option.enabled = self.layers.has_option(section, key)
+                self.remember(option)
+                self.update_search(option)
+        # Resetting everything is not recorded as deltas, history starts again
+        self.history.clear()
+        self.update_preview()
+
+    def _on_preview_clicked(self, *args):
+        if not self.preview:
+            self.gui.add_objects(('preview_window',))
+            self.preview = preview.GreeterPreview(self.gui['preview_image'], self.gui['preview_status'],
+                                                  self.prefs['greeter-data'])
+            self.update_preview()
+        self.gui['preview_window'].present()
+
+    def _on_profiles_clicked(self, *args):
+        if not self.profiles:
+            self.gui.add_objects(('profiles_window', 'profiles_diff_model'))
+            self.profiles = profiles.ProfileStore()
+            for name in self.profiles.names():
+                self.gui['profiles_name'].append_text(name)
+        self.update_profile_diff()
+        self.gui['profiles_window'].present()
+
+    def profile_name(self):
+        return self.gui['profiles_name'].get_child().props.text.strip()
+
+    def update_profile_diff(self):
+        model = self.gui['profiles_diff_model']
+        model.clear()
+        name = self.profile_name()
+        if name not in self.profiles.names():
+            return
+        try:
+            values = self.profiles.load(name)
+        except (OSError, ValueError) as e:
+            self.show_error(e)
+            return
+        unset = _('(not set)')
+        for section, key, current, value in profiles.diff(self.snapshot(), values):
+            model.append(('{}.{}'.format(section, key), unset if current is None else current,
+                          unset if value is None else value))
+
+    def _on_profile_selected(self, *args):
+        self.update_profile_diff()
+
+    def _on_profile_save_clicked(self, *args):
+        name = self.profile_name()
+        is_new = name not in self.profiles.names()
+        try:
+            self.profiles.save(name, self.snapshot())
+        except (OSError, ValueError) as e:
+            self.show_error(e)
+            return
+        if is_new:
+            self.gui['profiles_name'].append_text(name)
+        self.update_profile_diff()
+
+    def _on_profile_apply_clicked(self, *args):
+        try:
+            values = self.profiles.load(self.profile_name())
+        except (OSError, ValueError) as e:
+            self.show_error(e)
+            return
+        self.apply_profile(values)
+        self.update_profile_diff()
+
+    def _on_profile_delete_clicked(self, *args):
+        name = self.profile_name()
+        try:
+            self.profiles.delete(name)
+        except (OSError, ValueError) as e:
+            self.show_error(e)
+            return
+        combo = self.gui['profiles_name']
+        for i, row in enumerate(combo.get_model()):
+            if row[0] == name:
+                combo.remove(i)
+                break
+        combo.get_child().props.text = ''
+
+    def _on_profiles_window_delete(self, window, event):
+        window.hide()
+        return True
+
+    def _on_preview_window_delete(self, window, event):
+        window.hide()
+        return True
+
+    def _on_config_file_changed(self, monitor, file, other_file, event):
+        if event in (Gio.FileMonitorEvent.CHANGES_DONE_HINT, Gio.FileMonitorEvent.CREATED, Gio.FileMonitorEvent.DELETED):
+            self.refresh()
+
+    def _on_page_switched(self, notebook, page, page_num):
+        self.load_page(Gtk.Buildable.get_name(page))
+
+    def _on_first_frame(self, widget, cr):
+        self.main_window.disconnect(self._first_frame_handler)
+        self.profile.mark('first frame')
+        self.profile.report()
+
+    def _on_key_press(self, window, event):
+        if not event.state & Gdk.ModifierType.CONTROL_MASK:
+            return False
+        key = Gdk.keyval_to_lower(event.keyval)
+        if key == Gdk.KEY_z and not event.state & Gdk.ModifierType.SHIFT_MASK:
+            self.undo()
+        elif key in (Gdk.KEY_z, Gdk.KEY_y):
+            self.redo()
+        else:
+            return False
+        return True
 
     def _on_indicator_changed(self, selection):
         model, it = selection.get_selected()
         self.indicators_notebook.set_current_page(model[it][IndicatorOption.Model.PAGE])
 
-def main(argv=None, localedir=None, localedomain='lightdm-another-gtk-greeter-settings'):
+def instrument():
+    # Timing of main operations, used only with --trace options
+    trace.install(Application, ('create_gui', 'create_option', 'load_page', 'read', 'refresh', 'save', 'show_error'),
+                  {'create_option': lambda self, path, binding: {'option': '.'.join(path)},
+                   'load_page': lambda self, name: {'page': name},
+                   'show_error': lambda self, error: {'message': str(error)}})
+    # Overrides of _on_change call super(), so only the outermost call of an edit is recorded
+    for cls in {OptionWrapper} | set(WRAPPERS.values()):
+        trace.install(cls, ('_on_change',), {'_on_change': lambda self, *args, **kwargs: {'option': '.'.join(self.path)}},
+                      nested=False)
+
+def import_gui():
+    global Gtk, Gdk, Gio, GLib, preview, thumbnails
+    from gi.repository import Gtk, Gdk, Gio, GLib  # @UnusedImport
+    from . import preview, thumbnails
+
+def create_parser():
     parser = argparse.ArgumentParser()
     parser.add_argument("--greeter-config", dest='greeter-config', default='/etc/lightdm/lightdm-another-gtk-greeter.conf', help="Greeter configuartion file")
     parser.add_argument("--greeter-config-output", dest='greeter-config-output')
     parser.add_argument("--lightdm-config", dest='lightdm-config', default='/etc/lightdm/lightdm.conf', help="Lightdm configuartion file")
+    parser.add_argument("--save-layer", dest='save-layer', metavar='FILE', help="Save changes to this layer of lightdm configuration, path or file name in lightdm.conf.d (default: --greeter-config)")
     parser.add_argument("--greeter-data", dest='greeter-data', default='/usr/share/lightdm-another-gtk-greeter', help="Lightdm data directory")
     parser.add_argument("--ui-file", dest='ui-file', default='interface.ui')
+    parser.add_argument("--no-watch", dest='watch', action='store_false', help="Do not reload configuration file when it is changed by other programs")
+    parser.add_argument("--trace", dest='trace', metavar='FILE', help="Write timing of operations to JSON lines file ('-' for stderr)")
+    parser.add_argument("--trace-buffer", dest='trace-buffer', type=int, metavar='SIZE', help="Keep timing of last SIZE operations in memory, they are written to cache directory on SIGUSR1")
+    parser.add_argument("--startup-profile", dest='startup-profile', action='store_true', help="Print startup timing breakdown")
+    batch = parser.add_argument_group('batch mode', 'Change configuration files without starting the GUI')
+    batch.add_argument("--set", dest='set', action='append', default=[], metavar='SECTION.KEY=VALUE', help="Set option value")
+    batch.add_argument("--unset", dest='unset', action='append', default=[], metavar='SECTION.KEY', help="Remove option")
+    batch.add_argument("--apply-file", dest='apply-file', action='append', default=[], metavar='PATCH', help="Apply options from ini-file, keys without value are removed")
+    batch.add_argument("--config-list", dest='config-list', metavar='FILE', help="Read configuration paths from file, one per line ('-' for stdin)")
+    batch.add_argument("configs", nargs='*', metavar='CONFIG', help="Configuration files to change (default: --greeter-config)")
+    remote = parser.add_argument_group('remote mode', 'Apply changes to many hosts, targets are paths, file:///path or ssh://[user@]host[:port]/path URLs')
+    remote.add_argument("--targets", dest='targets', metavar='FILE', help="Read targets from file, one per line ('-' for stdin)")
+    remote.add_argument("--jobs", dest='jobs', type=int, help="Number of parallel workers (default: 8, number of CPUs for --lint)")
+    remote.add_argument("--strict", dest='strict', action='store_true', help="Do not change targets with values different from patch base")
+    parser.add_argument("--preflight", dest='preflight', action='store_true', help="Check files used by configuration files (--greeter-config, CONFIG files or --config-list) and exit")
+    parser.add_argument("--lightdm-user", dest='lightdm-user', default='lightdm', help="User which must be able to read greeter files")
+    parser.add_argument("--lint", dest='lint', action='store_true', help="Check configuration files (--greeter-config, CONFIG files and directories or --config-list) and exit")
+    parser.add_argument("--export", dest='export', choices=('json',), help="Write options of --greeter-config (with all lightdm configuration layers), CONFIG files or --config-list to stdout, one JSON object per line")
+    parser.add_argument("--import", dest='import', choices=('json',), help="Apply options from JSON objects read from stdin, one per line, to files in their \"path\" (default: --greeter-config)")
+    parser.add_argument("--export-patch", dest='export-patch', metavar='PATCH', help="Save changes as patch for --apply-file instead of changing configuration")
+    return parser
+
+def main(argv=None, localedir=None, localedomain='lightdm-another-gtk-greeter-settings'):
+    parser = create_parser()
     v = vars(parser.parse_args(args=argv))
-    global Gtk
-    from gi.repository import Gtk  # @UnusedImport
+    if (v['set'] or v['unset'] or v['apply-file']) and v['targets']:
+        from . import remote
+        return remote.run(v)
+    elif v['set'] or v['unset'] or v['apply-file']:
+        return batch.run(v)
+    elif v['lint']:
+        return validate.run(v)
+    elif v['preflight']:
+        return preflight.run(v)
+    elif v['export']:
+        return exchange.run_export(v)
+    elif v['import']:
+        return exchange.run_import(v)
+    elif v['configs'] or v['config-list'] or v['targets']:
+        parser.error('configuration files list requires --set, --unset, --apply-file, --lint, --preflight or --export')
+    profile = StartupProfile() if v['startup-profile'] else None
+    import_gui()
+    if v['trace'] or v['trace-buffer']:
+        trace.enable(v['trace'], v['trace-buffer'] or 1000)
+        instrument()
+    if profile:
+        profile.mark('import')
     if localedir:
         locale.bindtextdomain(localedomain, localedir)
         gettext.bindtextdomain(localedomain, localedir)
         gettext.textdomain(localedomain)
         v['localedomain'] = localedomain
-    Application(v).run()
+    Application(v, profile).run()
 
 if __name__ == '__main__':
     import sys
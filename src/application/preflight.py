@@ -0,0 +1,182 @@
+#!/usr/bin/python3
+
+import grp
+import os
+import pwd
+import stat
+import struct
+import sys
+import threading
+import xml.etree.ElementTree as ElementTree
+
+from concurrent.futures import ThreadPoolExecutor
+
+from . import cache
+from .batch import config_paths
+from .inifile import IniFile
+from .schema import OPTIONS, Background, Icon, option_prefs
+from .validate import Problem, report
+
+
+__all__ = ['Checker', 'assets', 'run']
+
+MAX_FILE_SIZE = 16 * 1024 * 1024
+MAX_IMAGE_SIZE = 8192
+LIGHTDM_USER = 'lightdm'
+
+def assets(values, prefs):
+    # values: (section, key) -> value; yields (section, key, path, is_image) for referenced files
+    for (section, key), value in sorted(values.items()):
+        option = OPTIONS.get(section, {}).get(key)
+        path = option and value and option.type.asset(value, option_prefs(option, prefs))
+        if path:
+            yield section, key, path, isinstance(option.type, (Background, Icon))
+
+def user_groups(user):
+    return {user.pw_gid} | {group.gr_gid for group in grp.getgrall() if user.pw_name in group.gr_mem}
+
+def readable_by(path, user, groups):
+    # True if user can read file, using permission bits of file and its directories
+    if user.pw_uid == 0:
+        return True
+    def allowed(st, mode):
+        if st.st_uid == user.pw_uid:
+            return st.st_mode & (mode << 6)
+        if st.st_gid in groups:
+            return st.st_mode & (mode << 3)
+        return st.st_mode & mode
+    path = os.path.abspath(path)
+    directory = os.path.dirname(path)
+    while True:
+        if not allowed(os.stat(directory), 1):
+            return False
+        if directory == os.path.dirname(directory):
+            break
+        directory = os.path.dirname(directory)
+    return bool(allowed(os.stat(path), 4))
+
+def jpeg_size(file):
+    file.seek(2)
+    while True:
+        marker = file.read(2)
+        if len(marker) < 2 or marker[0] != 0xff:
+            raise ValueError('broken JPEG file')
+        if 0xd0 <= marker[1] <= 0xd9 or marker[1] == 0x01:
+            continue
+        length, = struct.unpack('>H', file.read(2))
+        if 0xc0 <= marker[1] <= 0xcf and marker[1] not in (0xc4, 0xc8, 0xcc):
+            height, width = struct.unpack('>xHH', file.read(5))
+            return width, height
+        file.seek(length - 2, os.SEEK_CUR)
+
+def image_info(path):
+    # (format, width, height) from file header, size is None if it is not read. Raises ValueError for unknown format
+    with open(path, 'rb') as file:
+        head = file.read(32)
+        if head.startswith(b'\x89PNG\r\n\x1a\n') and head[12:16] == b'IHDR':
+            return ('png',) + struct.unpack('>II', head[16:24])
+        if head[:6] in (b'GIF87a', b'GIF89a'):
+            return ('gif',) + struct.unpack('<HH', head[6:10])
+        if head.startswith(b'BM') and len(head) >= 26:
+            width, height = struct.unpack('<ii', head[18:26])
+            return 'bmp', width, abs(height)
+        if head.startswith(b'\xff\xd8'):
+            return ('jpeg',) + jpeg_size(file)
+        if head.startswith(b'RIFF') and head[8:12] == b'WEBP':
+            return 'webp', None, None
+        if head[:4] in (b'II*\0', b'MM\0*'):
+            return 'tiff', None, None
+        if head.startswith(b'/* XPM */'):
+            return 'xpm', None, None
+        file.seek(0)
+        if b'<svg' in file.read(4096):
+            return 'svg', None, None
+    raise ValueError('unknown image format')
+
+def check_file(path, is_image, user=None, groups=()):
+    # Returns list of (level, message)
+    problems = []
+    st = os.stat(path)
+    if not stat.S_ISREG(st.st_mode):
+        return [('error', 'not a regular file: {}'.format(path))]
+    if user and not readable_by(path, user, groups):
+        problems.append(('error', 'not readable by user {}: {}'.format(user.pw_name, path)))
+    if st.st_size > MAX_FILE_SIZE:
+        problems.append(('warning', 'file is too large ({:.1f} MiB): {}'.format(st.st_size / 2 ** 20, path)))
+    try:
+        if is_image:
+            fmt, width, height = image_info(path)
+            if width is not None and (not width or not height):
+                problems.append(('error', 'empty {} image: {}'.format(fmt, path)))
+            elif width is not None and max(width, height) > MAX_IMAGE_SIZE:
+                problems.append(('warning', 'image is too large ({}x{}): {}'.format(width, height, path)))
+        elif path.endswith('.ui'):
+            ElementTree.parse(path)
+        elif path.endswith('.css'):
+            with open(path, encoding='utf-8') as file:
+                file.read()
+    except (ValueError, struct.error, ElementTree.ParseError) as e:
+        problems.append(('error', 'can not be decoded ({}): {}'.format(e, path)))
+    return problems
+
+class Checker:
+    # Results are kept in memory and disk cache by path, mtime, size and user
+
+    CACHE = 'preflight.json'
+    CACHE_VERSION = 1
+
+    def __init__(self, user=LIGHTDM_USER, workers=8):
+        try:
+            self._user = pwd.getpwnam(user) if user else None
+        except KeyError:
+            self._user = None
+        self._groups = user_groups(self._user) if self._user else set()
+        self._workers = workers or 8
+        self._results = cache.load(self.CACHE, self.CACHE_VERSION) or {}
+        self._lock = threading.Lock()
+        self._changed = False
+
+    def _check(self, path, is_image):
+        try:
+            st = os.stat(path)
+        except OSError as e:
+            return [('error', '{}: {}'.format(e.strerror, path))]
+        key = [st.st_mtime_ns, st.st_size, self._user.pw_name if self._user else None, is_image]
+        with self._lock:
+            cached = self._results.get(path)
+        if cached and cached[0] == key:
+            return [tuple(problem) for problem in cached[1]]
+        try:
+            problems = check_file(path, is_image, self._user, self._groups)
+        except OSError as e:
+            return [('error', '{}: {}'.format(e.strerror, path))]
+        with self._lock:
+            self._results[path] = [key, problems]
+            self._changed = True
+        return problems
+
+    def check(self, values, prefs):
+        # Returns list of Problem for files used by values
+        items = list(assets(values, prefs))
+        with ThreadPoolExecutor(max_workers=self._workers) as executor:
+            results = list(executor.map(lambda item: self._check(item[2], item[3]), items))
+        if self._changed:
+            cache.store(self.CACHE, self.CACHE_VERSION, self._results)
+            self._changed = False
+        return [Problem(None, level, section, key, message)
+                for (section, key, path, is_image), problems in zip(items, results) for level, message in problems]
+
+def check_paths(paths, checker, prefs):
+    # Yields (path, [Problem]) for every configuration file
+    for path in paths:
+        try:
+            config = IniFile.read(path, missing_ok=False)
+        except (OSError, UnicodeDecodeError) as e:
+            yield path, [Problem(None, 'error', None, None, str(e))]
+            continue
+        values = {(section, key): value for section in config.sections() for key, value in config.items(section)}
+        yield path, [problem._replace(line=config.line(problem.section, problem.key))
+                     for problem in checker.check(values, prefs)]
+
+def run(prefs, out=sys.stdout):
+    return report(check_paths(config_paths(prefs), Checker(prefs['lightdm-user'], prefs['jobs']), prefs), out)
@@ -0,0 +1,159 @@
+#!/usr/bin/python3
+
+import os
+import time
+
+from gi.repository import GdkPixbuf, GLib, Gtk, Pango
+
+import gettext
+_ = gettext.gettext
+
+
+__all__ = ['GreeterPreview']
+
+class GreeterPreview:
+    # Renders greeter ui-file in off-screen window with current options applied.
+    # Updates are debounced, changes of css-only options do not rebuild widgets.
+
+    DELAY = 150  # ms
+    FRAME_BUDGET = 1 / 60
+    STRUCTURE_KEYS = {'ui-file'}
+
+    def __init__(self, image, status, greeter_data, size=(480, 300)):
+        self._image = image
+        self._status = status
+        self._greeter_data = greeter_data
+        self._size = size
+        self._values = {}
+        self._dirty = set()
+        self._timeout = None
+        self._started = None
+        self._structure_changed = False
+        self._window = Gtk.OffscreenWindow()
+        self._window.set_default_size(*size)
+        self._window.connect('damage-event', self._on_damage)
+        self._providers = {name: Gtk.CssProvider() for name in ('theme', 'css-file', 'options')}
+        self._window.show()
+
+    def update(self, values):
+        # values: key -> value for appearance options
+        changed = {key for key, value in values.items() if self._values.get(key) != value}
+        if not changed:
+            return
+        self._values.update(values)
+        self._dirty |= changed
+        if self._timeout:
+            GLib.source_remove(self._timeout)
+        self._timeout = GLib.timeout_add(self.DELAY, self._render)
+
+    @property
+    def latency(self):
+        return getattr(self, '_latency', None)
+
+    def _path(self, key):
+        value = self._values.get(key)
+        return os.path.join(self._greeter_data, value) if value else None
+
+    def _render(self):
+        self._timeout = None
+        self._started = time.perf_counter()
+        self._structure_changed = bool(self._dirty & self.STRUCTURE_KEYS) or not self._window.get_child()
+        if self._structure_changed:
+            self._build()
+        if 'theme-name' in self._dirty:
+            previous = self._providers['theme']
+            theme = Gtk.CssProvider.get_named(self._values['theme-name'], None) if self._values.get('theme-name') else None
+            self._providers['theme'] = theme or Gtk.CssProvider()
+            self._apply_providers(self._window, (previous,))
+        if 'css-file' in self._dirty:
+            try:
+                self._providers['css-file'].load_from_path(self._path('css-file') or '')
+            except GLib.Error:
+                self._providers['css-file'].load_from_data(b'')
+        self._providers['options'].load_from_data(self._options_css().encode())
+        self._dirty.clear()
+        self._window.queue_draw()
+        return False
+
+    def _build(self):
+        child = self._window.get_child()
+        if child:
+            self._window.remove(child)
+        child = None
+        path = self._path('ui-file')
+        if path and os.path.isfile(path):
+            builder = Gtk.Builder()
+            try:
+                builder.add_from_file(path)
+            except GLib.Error:
+                pass
+            else:
+                window = next((obj for obj in builder.get_objects() if isinstance(obj, Gtk.Window)), None)
+                child = window.get_child() if window else None
+                if child:
+                    window.remove(child)
+        if not child:
+            child = self._sample()
+        self._window.add(child)
+        child.show()
+        self._apply_providers(self._window)
+
+    def _sample(self):
+        box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=6, halign=Gtk.Align.CENTER, valign=Gtk.Align.CENTER)
+        box.add(Gtk.Label(label=_('User name:')))
+        box.add(Gtk.Entry())
+        box.add(Gtk.Button(label=_('Log In')))
+        box.show_all()
+        return box
+
+    def _apply_providers(self, widget, removed=()):
+        # Style providers are not inherited, so they are added to every widget
+        context = widget.get_style_context()
+        for provider in removed:
+            context.remove_provider(provider)
+        for priority, name in enumerate(('theme', 'css-file', 'options'), Gtk.STYLE_PROVIDER_PRIORITY_APPLICATION - 1):
+            context.add_provider(self._providers[name], priority)
+        if isinstance(widget, Gtk.Container):
+            widget.forall(lambda child: self._apply_providers(child, removed))
+
+    def _options_css(self):
+        rules = []
+        if self._values.get('font-name'):
+            font = Pango.FontDescription.from_string(self._values['font-name'])
+            size = font.get_size() / Pango.SCALE
+            try:
+                size *= int(self._values.get('xft-dpi') or 96) / 96
+            except ValueError:
+                pass
+            rules.append('* {{ font-family: "{}"; font-size: {:.1f}pt; font-weight: {}; }}'
+                         .format(font.get_family() or 'Sans', size or 10, int(font.get_weight())))
+        background = self._values.get('background')
+        if background and background.startswith('#'):
+            rules.append('GtkOffscreenWindow, offscreenwindow {{ background-color: {}; background-image: none; }}'
+                         .format(background if len(background) in (4, 7) else self._short_color(background)))
+        elif background:
+            rules.append('GtkOffscreenWindow, offscreenwindow {{ background-image: url("{}"); background-size: cover; }}'
+                         .format(self._path('background').replace('"', '\\"')))
+        return '\n'.join(rules)
+
+    @staticmethod
+    def _short_color(color):
+        # '#rrrrggggbbbb' -> '#rrggbb'
+        digits = color[1:]
+        step = len(digits) // 3
+        return '#' + ''.join(digits[i * step:i * step + 2] for i in range(3)) if step >= 2 else color
+
+    def _on_damage(self, window, event):
+        pixbuf = window.get_pixbuf()
+        if pixbuf:
+            width, height = self._size
+            scale = min(width / pixbuf.get_width(), height / pixbuf.get_height(), 1)
+            self._image.set_from_pixbuf(pixbuf.scale_simple(max(1, int(pixbuf.get_width() * scale)),
+                                                            max(1, int(pixbuf.get_height() * scale)),
+                                                            GdkPixbuf.InterpType.BILINEAR))
+        if self._started is not None:
+            self._latency = time.perf_counter() - self._started
+            self._started = None
+            over = not self._structure_changed and self._latency > self.FRAME_BUDGET
+            self._status.props.label = _('Rendered in {:.1f} ms').format(self._latency * 1000) + (' (!)' if over else '')
+        return False
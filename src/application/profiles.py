@@ -0,0 +1,102 @@
+#!/usr/bin/python3
+
+import hashlib
+import json
+import os
+
+from .inifile import write_atomic
+
+
+__all__ = ['ProfileStore', 'diff']
+
+def data_path(*names):
+    base = os.environ.get('XDG_DATA_HOME') or os.path.expanduser('~/.local/share')
+    return os.path.join(base, 'lightdm-another-gtk-greeter-settings', *names)
+
+def write_file(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    write_atomic(path, data.encode())
+
+def format_section(values):
+    # Canonical section text, keys without value are not set
+    return ''.join(key + '\n' if value is None else '{}={}\n'.format(key, value) for key, value in sorted(values.items()))
+
+def parse_section(text):
+    values = {}
+    for line in text.splitlines():
+        key, eq, value = line.partition('=')
+        values[key] = value if eq else None
+    return values
+
+class ProfileStore:
+    # Named snapshots of (section, key) -> value, None for options that are not set.
+    # Sections are stored as objects named by hash of their text, profiles share equal sections
+
+    def __init__(self, directory=None):
+        self._directory = directory or data_path('profiles')
+
+    def _object_path(self, digest):
+        return os.path.join(self._directory, 'objects', digest[:2], digest[2:])
+
+    def _profile_path(self, name):
+        if not name or '/' in name or name.startswith('.'):
+            raise ValueError('invalid profile name: {!r}'.format(name))
+        return os.path.join(self._directory, name + '.json')
+
+    def names(self):
+        try:
+            return sorted(entry.name[:-5] for entry in os.scandir(self._directory)
+                          if entry.name.endswith('.json') and not entry.name.startswith('.'))
+        except OSError:
+            return []
+
+    def save(self, name, values):
+        sections = {}
+        for (section, key), value in values.items():
+            sections.setdefault(section, {})[key] = value
+        manifest = {}
+        for section, items in sections.items():
+            text = format_section(items)
+            digest = hashlib.sha1(text.encode()).hexdigest()
+            path = self._object_path(digest)
+            if not os.path.exists(path):
+                write_file(path, text)
+            manifest[section] = digest
+        write_file(self._profile_path(name), json.dumps(manifest, sort_keys=True, indent=1))
+
+    def load(self, name):
+        # Raises OSError or ValueError for missing or broken profile
+        with open(self._profile_path(name)) as file:
+            manifest = json.load(file)
+        values = {}
+        for section, digest in manifest.items():
+            with open(self._object_path(digest)) as file:
+                values.update(((section, key), value) for key, value in parse_section(file.read()).items())
+        return values
+
+    def delete(self, name):
+        os.unlink(self._profile_path(name))
+        self.collect()
+
+    def collect(self):
+        # Removes objects not used by any profile
+        used = set()
+        for name in self.names():
+            try:
+                with open(self._profile_path(name)) as file:
+                    used.update(json.load(file).values())
+            except (OSError, ValueError):
+                return  # Keep everything if some profile can not be read
+        for root, dirs, files in os.walk(os.path.join(self._directory, 'objects')):  # @UnusedVariable
+            for filename in files:
+                if os.path.basename(root) + filename not in used:
+                    try:
+                        os.unlink(os.path.join(root, filename))
+                    except OSError:
+                        pass
+
+def diff(current, profile):
+    # Returns sorted [(section, key, current value, profile value)] for options with different values
+    return sorted((section, key, current.get((section, key)), profile.get((section, key)))
+                  for section, key in current.keys() | profile.keys()
+                  if current.get((section, key)) != profile.get((section, key)))
@@ -0,0 +1,159 @@
+#!/usr/bin/python3
+
+import os
+import shlex
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from urllib.parse import urlsplit
+
+from .batch import PatchError, apply_patch, iter_configs, read_base, read_patch
+from .inifile import IniFile
+
+
+__all__ = ['run', 'apply_to_targets', 'TransportPool', 'LocalTransport', 'SSHTransport']
+
+class TransportError(Exception):
+    pass
+
+class LocalTransport:
+    # Files under local directory, e.g. mounted host images
+    def __init__(self, root='/'):
+        self._root = root
+    def _path(self, path):
+        return os.path.join(self._root, path.lstrip('/'))
+    def read(self, path):
+        with open(self._path(path), newline='') as file:
+            return file.read()
+    def write(self, path, text):
+        IniFile(text).write(self._path(path))
+    def close(self):
+        pass
+
+class SSHTransport:
+    # Uses ssh with shared master connection, all commands to the same host reuse it
+    def __init__(self, host, user=None, port=None):
+        self._control = os.path.join(tempfile.gettempdir(), 'greeter-settings-ssh-%C')
+        self._command = ['ssh', '-o', 'BatchMode=yes', '-o', 'ControlMaster=auto',
+                         '-o', 'ControlPath=' + self._control, '-o', 'ControlPersist=60']
+        if port:
+            self._command += ['-p', str(port)]
+        self._command.append('{}@{}'.format(user, host) if user else host)
+    def _run(self, command, data=None):
+        # Bytes are passed as they are, so line endings of remote files are kept
+        process = subprocess.run(self._command + ['--', command], input=data and data.encode(), stdout=subprocess.PIPE,
+                                 stderr=subprocess.PIPE)
+        if process.returncode:
+            raise TransportError(process.stderr.decode(errors='replace').strip() or
+                                 'ssh exited with code {}'.format(process.returncode))
+        return process.stdout.decode()
+    def read(self, path):
+        return self._run('cat {}'.format(shlex.quote(path)))
+    def write(self, path, text):
+        # Same as IniFile.write: temporary file, keep mode, sync, rename; the file is not replaced on errors
+        self._run('tmp=$(mktemp {0}.XXXXXX) || exit 1; '
+                  'if cat > "$tmp" && {{ chmod --reference={0} "$tmp" 2>/dev/null || chmod 644 "$tmp"; }} && '
+                  '{{ sync "$tmp" 2>/dev/null || true; }} && mv -f "$tmp" {0}; then exit 0; fi; '
+                  'rm -f "$tmp"; exit 1'.format(shlex.quote(path)), text)
+    def close(self):
+        subprocess.run(self._command[:-1] + ['-O', 'exit', self._command[-1]],
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+TRANSPORTS = {'file': LocalTransport, 'ssh': SSHTransport}
+
+class TransportPool:
+    # One transport per host, shared by all targets on it
+    def __init__(self):
+        self._transports = {}
+        self._lock = threading.Lock()
+    def get(self, target):
+        # Returns (transport, path) for 'path', 'file:///path' or 'ssh://[user@]host[:port]/path'
+        url = urlsplit(target)
+        if not url.scheme:
+            return self._get(('file', None, None, None)), os.path.abspath(target)
+        if url.scheme not in TRANSPORTS:
+            raise TransportError('unsupported transport: {}'.format(url.scheme))
+        try:
+            key = (url.scheme, url.hostname, url.username, url.port)
+        except ValueError as e:
+            raise TransportError('invalid target {}: {}'.format(target, e))
+        return self._get(key), url.path
+    def _get(self, key):
+        scheme = key[0]
+        with self._lock:
+            if key not in self._transports:
+                self._transports[key] = TRANSPORTS[scheme]() if scheme == 'file' else TRANSPORTS[scheme](*key[1:])
+            return self._transports[key]
+    def close(self):
+        for transport in self._transports.values():
+            transport.close()
+        self._transports.clear()
+
+Result = namedtuple('Result', ('target', 'status', 'changed', 'drift', 'error', 'duration'))
+
+def apply_to_target(pool, target, patch, base, strict=False):
+    start = time.perf_counter()
+    changed, drift = 0, []
+    try:
+        transport, path = pool.get(target)
+        config = IniFile(transport.read(path))
+        drift = ['{}.{}'.format(section, key) for (section, key), value in base.items()
+                 if config.get(section, key) != value]
+        if drift and strict:
+            status = 'drift'
+        else:
+            changed = apply_patch(config, patch)
+            if changed:
+                transport.write(path, config.text())
+            status = 'changed' if changed else 'unchanged'
+    except (OSError, UnicodeDecodeError, TransportError) as e:
+        return Result(target, 'error', 0, drift, str(e), time.perf_counter() - start)
+    return Result(target, status, changed, drift, None, time.perf_counter() - start)
+
+def apply_to_targets(targets, patch, base, jobs=8, strict=False, pool=None):
+    # Yields Result for every target as soon as it is done, at most jobs * 2 targets are queued
+    own_pool = pool is None
+    pool = pool or TransportPool()
+    try:
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            running = set()
+            for target in targets:
+                if len(running) >= jobs * 2:
+                    done, running = wait(running, return_when=FIRST_COMPLETED)
+                    yield from (future.result() for future in done)
+                running.add(executor.submit(apply_to_target, pool, target, patch, base, strict))
+            for future in running:
+                yield future.result()
+    finally:
+        if own_pool:
+            pool.close()
+
+def format_result(result):
+    text = '{}: {}'.format(result.target, result.status)
+    if result.changed:
+        text += ' ({})'.format(result.changed)
+    if result.error:
+        text += ': ' + result.error
+    if result.drift:
+        text += ' [drift: {}]'.format(', '.join(result.drift))
+    return text + ' {:.1f} ms'.format(result.duration * 1000)
+
+def run(prefs, out=sys.stdout):
+    try:
+        patch = read_patch(prefs['set'], prefs['unset'], prefs['apply-file'])
+        base = read_base(prefs['apply-file'])
+    except PatchError as e:
+        print('error: {}'.format(e), file=sys.stderr)
+        return 2
+    targets = iter_configs({'configs': prefs['configs'], 'config-list': prefs['targets']})
+    failed = 0
+    for result in apply_to_targets(targets, patch, base, prefs['jobs'] or 8, prefs['strict']):
+        failed += result.status in ('error', 'drift')
+        out.write(format_result(result) + '\n')
+        out.flush()
+    return 1 if failed else 0
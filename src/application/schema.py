@@ -0,0 +1,277 @@
+#!/usr/bin/python3
+
+import hashlib
+import math
+import os
+import re
+import xml.etree.ElementTree as ElementTree
+
+from collections import namedtuple
+from collections.abc import Mapping
+
+from . import cache
+
+
+__all__ = ['OPTIONS', 'Option', 'Binding', 'get_index', 'format_values', 'generated_options', 'option_label', 'option_prefs', 'to_bool', 'format_bool']
+
+TRUE_STRINGS = {'1', 'true', 'yes', 'on', 'enabled'}
+FALSE_STRINGS = {'0', 'false', 'no', 'off', 'disabled'}
+
+def to_bool(s):
+    return s.lower() in TRUE_STRINGS if type(s) is str else bool(s)
+
+def format_bool(s):
+    if s.lower() not in TRUE_STRINGS | FALSE_STRINGS:
+        raise ValueError('invalid boolean value: {!r}'.format(s))
+    return str(int(to_bool(s)))
+
+
+COLOR_RE = re.compile(r'^#?([0-9A-Fa-f]{3}){1,4}$|^#?[A-Za-z][A-Za-z0-9 ]*$')
+
+def resolve_path(value, prefs):
+    return os.path.join(prefs.get('current_dir', ''), value)
+
+def check_file(value, prefs):
+    path = resolve_path(value, prefs)
+    if not os.path.isfile(path):
+        raise ValueError('file not found: {}'.format(path))
+    if not os.access(path, os.R_OK):
+        raise ValueError('file is not readable: {}'.format(path))
+
+class ValueType:
+    # Widget names used by option wrapper (besides '' and 'label'), '' is used if empty
+    fields = ()
+    # Option can be edited with generated widget if ui-file has no widgets for it
+    generic = True
+    def format_value(self, value):
+        # Converts configuration string to the form written by save(), raises ValueError
+        return value
+    def validate(self, value, prefs):
+        # Raises ValueError for bad value, prefs are formatted option prefs
+        self.format_value(value)
+    def asset(self, value, prefs):
+        # Path of file used by value, None if value does not refer to file
+        return None
+
+class Boolean(ValueType):
+    def format_value(self, value):
+        return format_bool(value)
+
+class String(ValueType):
+    pass
+
+class Integer(ValueType):
+    def __init__(self, minimum=None, maximum=None):
+        self.minimum = minimum
+        self.maximum = maximum
+    def format_value(self, value):
+        return str(int(value))
+    def validate(self, value, prefs):
+        number = int(value)
+        if (self.minimum is not None and number < self.minimum) or (self.maximum is not None and number > self.maximum):
+            raise ValueError('{} is out of range [{}, {}]'.format(number, self.minimum, self.maximum))
+
+class Choice(ValueType):
+    def __init__(self, choices):
+        self.choices = tuple(choices)
+    def format_value(self, value):
+        # Empty value means greeter default
+        if value and value not in self.choices:
+            raise ValueError('{!r} is not one of: {}'.format(value, ', '.join(self.choices)))
+        return value
+
+class Font(ValueType):
+    pass
+
+class Path(ValueType):
+    def validate(self, value, prefs):
+        if value:
+            check_file(value, prefs)
+    def asset(self, value, prefs):
+        return resolve_path(value, prefs) if value else None
+
+class Background(ValueType):
+    fields = ('file', 'color', 'is_file', 'is_color')
+    generic = False
+    def validate(self, value, prefs):
+        if value.startswith('#'):
+            if not COLOR_RE.match(value):
+                raise ValueError('invalid color: {}'.format(value))
+        elif value:
+            check_file(value, prefs)
+    def asset(self, value, prefs):
+        return resolve_path(value, prefs) if value and not value.startswith('#') else None
+
+class Icon(ValueType):
+    fields = ('file', 'icon', 'is_file', 'is_icon')
+    generic = False
+    def validate(self, value, prefs):
+        if value.startswith('#'):
+            if not value[1:] or '/' in value:
+                raise ValueError('invalid icon name: {}'.format(value))
+        elif value:
+            check_file(value, prefs)
+    def asset(self, value, prefs):
+        return resolve_path(value, prefs) if value and not value.startswith('#') else None
+
+class FontScale(ValueType):
+    fields = ('scale', 'use', 'disabled')
+    generic = False
+    def format_value(self, value):
+        return str(float(value)) if value else ''
+    def validate(self, value, prefs):
+        if value and not (math.isfinite(float(value)) and float(value) > 0):
+            raise ValueError('scale must be a positive number: {}'.format(value))
+
+class OSK(ValueType):
+    fields = ('use_onboard', 'use_command', 'command')
+    generic = False
+
+class Indicator(Boolean):
+    generic = False
+
+
+def format_values(values):
+    # (section, key) -> value formatted like save() writes it, so equal values compare equal; bad values are kept
+    formatted = {}
+    for (section, key), value in values.items():
+        option = OPTIONS.get(section, {}).get(key)
+        try:
+            formatted[section, key] = option.type.format_value(value) if option and value is not None else value
+        except ValueError:
+            formatted[section, key] = value
+    return formatted
+
+def option_prefs(option, prefs):
+    # Option prefs with str values formatted by application prefs
+    return {k: v.format_map(prefs) if type(v) is str else v for k, v in option.prefs.items()}
+
+# widgets: extra widgets names (tuple) or mapping name -> widget; '/name' is an absolute object id
+# prefs: passed to option wrapper, str values are formatted with application prefs
+Option = namedtuple('Option', ('type', 'default', 'widgets', 'prefs'))
+Option.__new__.__defaults__ = ((), {})
+
+INDICATOR_WIDGETS = {'': '/indicators_model', 'toggle': '/indicators_renderer_toggle'}
+
+OPTIONS = \
+{
+    'appearance': \
+    {
+        'theme-name': Option(String(), 'default', (), {'catalog': 'themes'}),
+        'icon-theme-name': Option(String(), 'default', (), {'catalog': 'icons'}),
+        'background': Option(Background(), '', ('preview',), {'current_dir': '{greeter-data}'}),
+        'ui-file': Option(Path(), '', (), {'current_dir': '{greeter-data}'}),
+        'css-file': Option(Path(), '', (), {'current_dir': '{greeter-data}'}),
+        'logo': Option(Icon(), '', ('preview',), {'current_dir': '{greeter-data}'}),
+        'font-name': Option(Font(), ''),
+        'fixed-user-image-size': Option(Boolean(), True),
+        'list-view-image-size': Option(Integer(16, 256), 48),
+        'xft-hintstyle': Option(Choice(('none', 'slight', 'medium', 'full')), 'slight'),
+        'xft-rgba': Option(Choice(('none', 'rgb', 'bgr', 'vrgb', 'vbgr')), 'none'),
+        'xft-antialias': Option(Boolean(), True),
+        'xft-dpi': Option(Integer(1, 1000), 96),
+        'user-name-format': Option(String(), ''),
+        'date-format': Option(String(), '')
+    },
+    'greeter': \
+    {
+        'allow-other-users': Option(Boolean(), False),
+        'show-language-selector': Option(Boolean(), True),
+        'show-session-icon': Option(Boolean(), False),
+    },
+    'panel': \
+    {
+        'show-panel': Option(Boolean(), True),
+        'panel-at-top': Option(Boolean(), True, ('panel-at-bottom',)),
+    },
+    'clock': \
+    {
+        'enabled': Option(Indicator(), True, INDICATOR_WIDGETS, {'page': 'clock'}),
+        'date-format': Option(String(), ''),
+        'time-format': Option(String(), ''),
+        'show-calendar': Option(Boolean(), True),
+    },
+    'layout': \
+    {
+        'enabled': Option(Indicator(), True, INDICATOR_WIDGETS, {'page': 'layout'}),
+    },
+    'power': \
+    {
+        'enabled': Option(Indicator(), True, INDICATOR_WIDGETS, {'page': 'power'}),
+        'suspend-prompt': Option(Boolean(), True),
+        'hibernate-prompt': Option(Boolean(), True),
+        'restart-prompt': Option(Boolean(), True),
+        'shutdown-prompt': Option(Boolean(), True),
+    },
+    'a11y': \
+    {
+        'enabled': Option(Indicator(), False, INDICATOR_WIDGETS, {'page': 'a11y'}),
+        'theme-name-contrast': Option(String(), '', (), {'catalog': 'themes'}),
+        'icon-theme-name-contrast': Option(String(), '', (), {'catalog': 'icons'}),
+        'font-scale': Option(FontScale(), '1.2'),
+        'osk': Option(OSK(), '#onboard'),
+    }
+}
+
+
+# widgets: name -> object id (None if there is no such object in ui file)
+# available: all required widgets exist
+# objects: top-level objects containing option widgets, option can be created when all of them are loaded
+Binding = namedtuple('Binding', ('widgets', 'available', 'objects'))
+
+def widget_ids(section, key, option):
+    names = {'': '', 'label': 'label'}
+    names.update((name, name) for name in option.type.fields)
+    if isinstance(option.widgets, Mapping):
+        names.update(option.widgets)
+    elif option.widgets:
+        names.update((name.lstrip('/'), name) for name in option.widgets)
+    return {name: '_'.join(filter(None, (section, key, widget))) if not widget.startswith('/') else widget[1:]
+            for name, widget in names.items()}
+
+def toplevel_objects(ui_file):
+    # Object id -> id of its top-level object
+    tops = {}
+    for top in ElementTree.parse(ui_file).getroot().iterfind('object'):
+        tops.update((obj.get('id'), top.get('id')) for obj in top.iter('object'))
+    return tops
+
+def compile_index(ui_file):
+    tops = toplevel_objects(ui_file)
+    index = {}
+    for section, keys in OPTIONS.items():
+        for key, option in keys.items():
+            widgets = {name: id if id in tops else None for name, id in widget_ids(section, key, option).items()}
+            available = all(widgets[name] for name in option.type.fields or ('',))
+            index[section, key] = Binding(widgets, available, frozenset(tops[id] for id in widgets.values() if id))
+    return index
+
+def option_label(key):
+    # Label text of generated widget
+    return key.replace('-', ' ').capitalize()
+
+def generated_options(index):
+    # Options without widgets in ui-file which can be edited with generated ones
+    return sorted(path for path, binding in index.items()
+                  if not binding.available and OPTIONS[path[0]][path[1]].type.generic)
+
+def fingerprint():
+    spec = [(section, key, option.type.fields, option.widgets)
+            for section, keys in sorted(OPTIONS.items()) for key, option in sorted(keys.items())]
+    return hashlib.sha1(repr(spec).encode()).hexdigest()
+
+def get_index(ui_file):
+    # (section, key) -> Binding, cached by ui file modification time
+    try:
+        st = os.stat(ui_file)
+    except OSError:
+        return compile_index(ui_file)
+    cache_key = [os.path.abspath(ui_file), st.st_mtime_ns, st.st_size, fingerprint()]
+    cached = cache.load('schema-index.json', cache_key)
+    if cached is not None:
+        return {(section, key): Binding(widgets, available, frozenset(objects))
+                for section, key, widgets, available, objects in cached}
+    index = compile_index(ui_file)
+    cache.store('schema-index.json', cache_key,
+                [(section, key, b.widgets, b.available, sorted(b.objects)) for (section, key), b in index.items()])
+    return index
@@ -0,0 +1,61 @@
+#!/usr/bin/python3
+
+import xml.etree.ElementTree as ElementTree
+
+from .schema import generated_options, option_label
+
+
+__all__ = ['SearchIndex']
+
+def label_texts(ui_file, ids, translate=None):
+    # Object id -> label text of given objects, translatable ones are passed to translate
+    texts = {}
+    for obj in ElementTree.parse(ui_file).getroot().iter('object'):
+        if obj.get('id') not in ids:
+            continue
+        prop = obj.find("property[@name='label']")
+        if prop is not None and prop.text:
+            texts[obj.get('id')] = translate(prop.text) if translate and prop.get('translatable') == 'yes' else prop.text
+    return texts
+
+class SearchIndex:
+    # Options searchable by section, key, label text and current value.
+    # Labels are read from ui-file once, so options of not yet loaded pages are found too.
+    # Options with generated widgets are found by label made from key
+
+    def __init__(self, index, ui_file, translate=None):
+        # index: (section, key) -> schema.Binding
+        ids = {binding.widgets['label']: path for path, binding in index.items()
+               if binding.available and binding.widgets.get('label')}
+        texts = label_texts(ui_file, ids, translate)
+        generated = generated_options(index)
+        self._paths = sorted(path for path, binding in index.items() if binding.available) + generated
+        self._labels = {path: '' for path in self._paths}
+        self._labels.update((path, option_label(path[1])) for path in generated)
+        self._labels.update((path, texts.get(id, '').replace('_', '').rstrip(': ')) for id, path in ids.items())
+        self._text = {}
+        for section, key in self._paths:
+            self._text[section, key] = ' '.join((section, '{}.{}'.format(section, key), key.replace('-', ' '),
+                                                 self._labels[section, key])).lower()
+        self._values = dict.fromkeys(self._paths, '')
+
+    def update(self, path, value):
+        if path in self._values:
+            self._values[path] = '' if value is None else str(value).lower()
+
+    def label(self, path):
+        return self._labels.get(path, '')
+
+    def search(self, query, limit=50):
+        # Options matching all words of query
+        words = query.lower().split()
+        if not words:
+            return []
+        found = []
+        for path in self._paths:
+            text, value = self._text[path], self._values[path]
+            if all(word in text or word in value for word in words):
+                found.append(path)
+                if len(found) >= limit:
+                    break
+        return found
@@ -0,0 +1,123 @@
+#!/usr/bin/python3
+
+import hashlib
+import os
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from gi.repository import GdkPixbuf, GLib, Gtk
+
+from . import cache
+
+
+__all__ = ['Thumbnailer', 'show', 'show_color']
+
+class Thumbnailer:
+    # Loads and scales images in worker threads, results are cached on disk by path, mtime and size.
+    # Only the last request of every consumer is delivered, previous ones are cancelled or dropped.
+
+    def __init__(self, workers=2, max_entries=256):
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._requests = {}
+        self._directory = cache.cache_path('thumbnails')
+        self._max_entries = max_entries
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def request(self, consumer, source, size, callback, theme=None):
+        # source: file path or '#icon-name', theme: icon theme name for icons (None for default one),
+        # callback(pixbuf or None) is called in main loop
+        previous = self._requests.pop(consumer, None)
+        if previous:
+            previous.cancel()
+        future = self._executor.submit(self._load, source, size, theme)
+        self._requests[consumer] = future
+        future.add_done_callback(lambda f: GLib.idle_add(self._deliver, consumer, f, callback))
+
+    def cancel(self, consumer):
+        previous = self._requests.pop(consumer, None)
+        if previous:
+            previous.cancel()
+
+    def _deliver(self, consumer, future, callback):
+        if self._requests.get(consumer) is future:
+            del self._requests[consumer]
+            callback(None if future.exception() else future.result())
+        return False
+
+    def _load(self, source, size, theme=None):
+        if source.startswith('#'):
+            return self._load_icon(source[1:], size, theme)
+        st = os.stat(source)
+        key = '{}:{}:{}:{}'.format(os.path.abspath(source), st.st_mtime_ns, st.st_size, size)
+        path = os.path.join(self._directory, hashlib.sha1(key.encode()).hexdigest() + '.png')
+        try:
+            pixbuf = GdkPixbuf.Pixbuf.new_from_file(path)
+        except GLib.Error:
+            pass
+        else:
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+            return pixbuf
+        pixbuf = GdkPixbuf.Pixbuf.new_from_file_at_scale(source, size, size, True)
+        try:
+            os.makedirs(self._directory, exist_ok=True)
+            pixbuf.savev(path, 'png', [], [])
+        except (OSError, GLib.Error):
+            pass
+        else:
+            self._evict()
+        return pixbuf
+
+    def _load_icon(self, name, size, theme):
+        # Icon theme object is not shared between threads, GTK settings are read in main thread only
+        if not hasattr(self._local, 'theme'):
+            self._local.theme = Gtk.IconTheme()
+            self._local.theme_name = None
+        if theme != self._local.theme_name:
+            self._local.theme.set_custom_theme(theme)
+            self._local.theme_name = theme
+        return self._local.theme.load_icon(name, size, Gtk.IconLookupFlags.FORCE_SIZE) if name else None
+
+    def _evict(self):
+        # Removes least recently used thumbnails
+        with self._lock:
+            try:
+                entries = [entry for entry in os.scandir(self._directory) if entry.name.endswith('.png')]
+            except OSError:
+                return
+            if len(entries) <= self._max_entries:
+                return
+            entries.sort(key=lambda entry: entry.stat().st_mtime)
+            for entry in entries[:len(entries) - self._max_entries]:
+                try:
+                    os.unlink(entry.path)
+                except OSError:
+                    pass
+
+
+_thumbnailer = None
+
+def show(image, source, size=64, theme=None):
+    # Shows thumbnail of file or icon in Gtk.Image, icons are taken from theme or from theme of GTK settings
+    global _thumbnailer
+    if not _thumbnailer:
+        _thumbnailer = Thumbnailer()
+    if not source:
+        _thumbnailer.cancel(image)
+        image.set_from_icon_name('image-missing', Gtk.IconSize.DIALOG)
+        return
+    if theme is None and source.startswith('#'):
+        theme = Gtk.Settings.get_default().props.gtk_icon_theme_name
+    _thumbnailer.request(image, source, size,
+                         lambda pixbuf: image.set_from_pixbuf(pixbuf) if pixbuf else
+                                        image.set_from_icon_name('image-missing', Gtk.IconSize.DIALOG), theme)
+
+def show_color(image, color, size=64):
+    if _thumbnailer:
+        _thumbnailer.cancel(image)
+    pixbuf = GdkPixbuf.Pixbuf.new(GdkPixbuf.Colorspace.RGB, False, 8, size, size)
+    pixbuf.fill((color.red >> 8) << 24 | (color.green >> 8) << 16 | (color.blue >> 8) << 8 | 0xff)
+    image.set_from_pixbuf(pixbuf)
@@ -0,0 +1,99 @@
+#!/usr/bin/python3
+
+import functools
+import json
+import os
+import signal
+import sys
+import threading
+import time
+
+from collections import deque
+
+from . import cache
+
+
+__all__ = ['enable', 'event', 'install', 'dump']
+
+# Nothing is recorded and no method is wrapped until enable() is called
+_sink = None
+# (method name, object id) of running calls which are recorded only once
+_running = threading.local()
+
+class FileSink:
+    # JSON lines, every record is flushed
+    def __init__(self, path):
+        self._file = sys.stderr if path == '-' else open(path, 'a', buffering=1)
+    def write(self, record):
+        self._file.write(json.dumps(record) + '\n')
+
+class RingSink:
+    # Last records, written to file by dump()
+    def __init__(self, size):
+        self.records = deque(maxlen=size)
+    def write(self, record):
+        self.records.append(record)
+
+def enable(path=None, size=1000):
+    # Records to JSON lines file, or to ring buffer which is dumped on SIGUSR1 if path is None
+    global _sink
+    if path:
+        _sink = FileSink(path)
+    else:
+        _sink = RingSink(size)
+        signal.signal(signal.SIGUSR1, lambda signum, frame: dump())
+
+def dump(path=None):
+    # Writes ring buffer as JSON lines, returns path
+    path = path or cache.cache_path('trace-{}.jsonl'.format(os.getpid()))
+    if not isinstance(_sink, RingSink):
+        return None
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as file:
+        file.writelines(json.dumps(record) + '\n' for record in list(_sink.records))
+    print('trace: {} events written to {}'.format(len(_sink.records), path), file=sys.stderr)
+    return path
+
+def event(name, duration=None, **fields):
+    if _sink is None:
+        return
+    record = {'time': round(time.time(), 6), 'event': name}
+    if duration is not None:
+        record['ms'] = round(duration * 1000, 3)
+    record.update(fields)
+    _sink.write(record)
+
+def traced(name, func, fields=None, nested=True):
+    # fields(*args, **kwargs) returns extra record fields.
+    # If nested is False, calls of the same method of the same object made inside recorded one
+    # (e.g. override calling super()) are not recorded
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        call = (func.__name__, id(args[0]) if args else None)
+        if not nested:
+            running = _running.__dict__.setdefault('calls', set())
+            if call in running:
+                return func(*args, **kwargs)
+            running.add(call)
+        start = time.perf_counter()
+        error = None
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            error = repr(e)
+            raise
+        finally:
+            if not nested:
+                running.discard(call)
+            extra = fields(*args, **kwargs) if fields else {}
+            if error:
+                extra['error'] = error
+            event(name, time.perf_counter() - start, **extra)
+    return wrapper
+
+def install(cls, names, fields=None, nested=True):
+    # Replaces methods of class with timed ones, methods inherited from base classes are skipped
+    fields = fields or {}
+    for name in names:
+        if name in cls.__dict__:
+            setattr(cls, name, traced('{}.{}'.format(cls.__name__, name), cls.__dict__[name], fields.get(name), nested))
@@ -0,0 +1,119 @@
+#!/usr/bin/python3
+
+import os
+import sys
+
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+from .batch import config_paths
+from .inifile import IniFile
+from .schema import OPTIONS, option_prefs
+
+
+__all__ = ['Problem', 'check_value', 'validate_config', 'lint_paths', 'report', 'run']
+
+Problem = namedtuple('Problem', ('line', 'level', 'section', 'key', 'message'))
+
+def check_value(section, key, value, prefs):
+    # Returns error message for bad value of known option, None if value is valid.
+    # prefs are application prefs, they are used to resolve relative paths
+    option = OPTIONS[section][key]
+    try:
+        option.type.validate(str(value), option_prefs(option, prefs))
+    except ValueError as e:
+        return str(e) or 'invalid value: {!r}'.format(value)
+    return None
+
+def validate_config(config, prefs, check=check_value):
+    # Returns list of Problem for IniFile config
+    problems = []
+    for section in config.sections():
+        if section not in OPTIONS:
+            problems.append(Problem(None, 'warning', section, None, 'unknown section'))
+            continue
+        for key, value in config.items(section):
+            if key not in OPTIONS[section]:
+                problems.append(Problem(config.line(section, key), 'warning', section, key, 'unknown option'))
+                continue
+            message = check(section, key, value, prefs)
+            if message:
+                problems.append(Problem(config.line(section, key), 'error', section, key, message))
+    return problems
+
+@lru_cache(maxsize=4096)
+def _check_value_cached(section, key, value, greeter_data):
+    return check_value(section, key, value, {'greeter-data': greeter_data})
+
+def check_value_cached(section, key, value, prefs):
+    # Fleets share most values, every distinct value is checked once per process
+    return _check_value_cached(section, key, value, prefs['greeter-data'])
+
+def lint_file(path, greeter_data):
+    try:
+        config = IniFile.read(path, missing_ok=False)
+    except (OSError, UnicodeDecodeError) as e:
+        return [Problem(None, 'error', None, None, str(e))]
+    return validate_config(config, {'greeter-data': greeter_data}, check_value_cached)
+
+def lint_chunk(paths, greeter_data):
+    return [(path, lint_file(path, greeter_data)) for path in paths]
+
+def iter_files(paths):
+    # Directories are searched recursively for *.conf files
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                yield from (os.path.join(root, name) for name in sorted(files) if name.endswith('.conf'))
+        else:
+            yield path
+
+def chunks(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def lint_paths(paths, greeter_data, jobs=None, chunk_size=64):
+    # Yields (path, problems) in order of paths, files are linted by chunks in worker processes
+    chunked = chunks(iter_files(paths), chunk_size)
+    if jobs == 1:
+        for chunk in chunked:
+            yield from lint_chunk(chunk, greeter_data)
+        return
+    jobs = jobs or os.cpu_count() or 1
+    with ProcessPoolExecutor(jobs) as executor:
+        running = deque()
+        for chunk in chunked:
+            if len(running) >= jobs * 2:
+                yield from running.popleft().result()
+            running.append(executor.submit(lint_chunk, chunk, greeter_data))
+        while running:
+            yield from running.popleft().result()
+
+def format_problem(path, problem):
+    location = '{}:{}'.format(path, problem.line) if problem.line else path
+    name = '.'.join(filter(None, (problem.section, problem.key)))
+    return '{}: {}: {}{}'.format(location, problem.level, name + ': ' if name else '', problem.message)
+
+def report(results, out=sys.stdout):
+    # results: (path, [Problem]) for every checked file, returns exit code
+    files = errors = warnings = 0
+    for path, problems in results:
+        files += 1
+        for problem in problems:
+            errors += problem.level == 'error'
+            warnings += problem.level == 'warning'
+            out.write(format_problem(path, problem) + '\n')
+    out.write('{} files, {} errors, {} warnings\n'.format(files, errors, warnings))
+    out.flush()
+    return 1 if errors else 0
+
+def run(prefs, out=sys.stdout):
+    return report(lint_paths(config_paths(prefs), prefs['greeter-data'], prefs['jobs']), out)